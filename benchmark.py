@@ -0,0 +1,263 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+import main
+
+COLUMNS = ['Tax ID', 'Organization First Name', 'Organization Middle Name', 'Organization Last Name',
+           'Organization Street Line1 Address', 'Organization Street Line2 Address', 'Organization City',
+           'Organization State', 'Organization Zip code', 'Start Date of Contract', 'Amount of Contract', '']
+FIRST_NAMES = ["JOHN", "MARY", "ALICE", "ROBERT", "LINDA", "MICHAEL", "SUSAN", "DAVID", "KAREN", "JOSE"]
+ORGANIZATION_NAMES = ["SUNNY KIDS", "HAPPY DAYCARE", "LITTLE STARS ACADEMY", "OAK PARK PRESCHOOL", "RIVER CLUB INC"]
+LAST_NAMES = ["SMITH", "JOHNSON", "GARCIA", "NGUYEN", "O'NEIL", "BROWN", "LEE", "DOE JR."]
+STREETS = ["MAIN ST", "ELM ST", "J STREET", "FOLSOM BLVD", "WATT AVE", "FRANKLIN BLVD"]
+CITIES = ["SACRAMENTO", "ELK GROVE", "FOLSOM", "CITRUS HEIGHTS", "RANCHO CORDOVA"]
+
+
+class StubCursor:
+
+    def __init__(self, records, latency=0.0):
+        self.records = records
+        self.latency = latency
+        self.description = [('SSN',), ('FIRST_NAME',), ('LAST_NAME',), ('MID_NAME',)]
+        self.rows = []
+        self.queries = 0
+
+    def execute(self, query, params=None):
+        if self.latency:
+            time.sleep(self.latency)
+        self.queries += 1
+        self.rows = [self.records[str(tax_id)] for tax_id in params or [] if str(tax_id) in self.records]
+        return self
+
+    def fetchmany(self, size=1):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+def generate_source_file(path, rows, run_date, county="County of Sacramento", exception_rate=0.05,
+                         misalignment_rate=0.02, duplicate_rate=0.02, seed=0, first_tax_id=100000000,
+                         previous_tax_ids=None, cross_period_duplicate_rate=0.0):
+    rnd = random.Random(seed)
+    records = {}
+    lines = [f"{county},,,,,,,,,,,",
+             "Contract Payments Report,,,,,,,,,,,",
+             f"Run Date: {run_date.strftime('%b-%d-%y')} 08:00 AM,,,,,,,,,,,",
+             ",,,,,,,,,,,",
+             ",,,,,,,,,,,",
+             ','.join(COLUMNS)]
+    generated = []
+    for index in range(rows):
+        if generated and rnd.random() < duplicate_rate:
+            generated.append(rnd.choice(generated[-100:]))
+            continue
+        tax_id = str(first_tax_id + index)
+        if previous_tax_ids and rnd.random() < cross_period_duplicate_rate:
+            tax_id = rnd.choice(previous_tax_ids)
+        first_name = rnd.choice(FIRST_NAMES)
+        line1 = f"{rnd.randrange(1, 9999)} {rnd.choice(STREETS)}"
+        in_database = True
+        if rnd.random() < exception_rate:
+            exception_kind = rnd.randrange(4)
+            if exception_kind == 0:
+                first_name = rnd.choice(ORGANIZATION_NAMES)
+            elif exception_kind == 1:
+                line1 = ''
+            elif exception_kind == 2:
+                tax_id = f"{tax_id[:3]}-{tax_id[3:5]}-{tax_id[5:]}"
+                in_database = False
+            else:
+                in_database = False
+        if in_database:
+            records[tax_id] = (tax_id, first_name, rnd.choice(LAST_NAMES), rnd.choice(["A", "M", None]))
+        line2 = rnd.choice(["", "", "APT 4", "STE. 100", "UNIT #2"])
+        zip_code = rnd.choice(["95814", "95624", "95630-1234"])
+        start_date = f"{rnd.randrange(1, 13):02d}/{rnd.randrange(1, 29):02d}/{run_date.year - rnd.randrange(3)}"
+        amount = f"\"${rnd.randrange(100, 250000):,}\""
+        row = [tax_id, first_name, rnd.choice(["", "A", "B."]), rnd.choice(LAST_NAMES), line1, line2,
+               rnd.choice(CITIES), "CA", zip_code, start_date, amount, ""]
+        if line1 and rnd.random() < misalignment_rate:
+            number, street = line1.split(' ', 1)
+            row = row[:4] + [number, street] + row[5:11]
+        generated.append(','.join(row))
+    lines.extend(generated)
+    with open(path, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+    return records
+
+
+def generate_previous_periods(run_date, rows, directories, args):
+    # Outputs for the earlier periods of the year, so the timed run compares PICs against a realistic index.
+    source_file = os.path.join(directories['source'], 'county.csv')
+    generate_source_file(source_file, 0, run_date)
+    _, _, comparisons, _ = main.DataProcessor.extract_date_range(source_file)
+    os.remove(source_file)
+    records = {}
+    previous_rows = args.previous_rows if args.previous_rows is not None else rows
+    for index, comparison in enumerate(comparisons):
+        period_file = os.path.join(directories['source'], f"county_{comparison.lower()}.csv")
+        records.update(generate_source_file(period_file, previous_rows, datetime.strptime(comparison, '%b_%d_%y'),
+                                            exception_rate=args.exception_rate, misalignment_rate=args.misalignment_rate,
+                                            duplicate_rate=args.duplicate_rate, seed=args.seed + index + 1,
+                                            first_tax_id=200000000 + index * previous_rows))
+    if comparisons:
+        main.connection_provider = main.ConnectionProvider(lambda: StubCursor(records))
+        main.record_lookup = main.RecordLookup(batch_size=args.lookup_batch_size, workers=args.lookup_workers)
+        main.metrics_path = None
+        logging.info(f"Processing {len(comparisons)} previous periods untimed: {', '.join(comparisons)}")
+        main.DataProcessor.process_data(directories['source'], directories['archive'], directories['exceptions'],
+                                        directories['output'])
+    return records
+
+
+def benchmark_size(rows, work_dir, args):
+    size_dir = os.path.join(work_dir, str(rows))
+    directories = {name: os.path.join(size_dir, name) for name in ('source', 'archive', 'exceptions', 'output')}
+    for directory in directories.values():
+        os.makedirs(directory, exist_ok=True)
+    run_date = datetime.strptime(args.run_date, '%Y-%m-%d')
+    previous_records = generate_previous_periods(run_date, rows, directories, args)
+    source_file = os.path.join(directories['source'], 'county.csv')
+
+    started = time.perf_counter()
+    records = generate_source_file(source_file, rows, run_date, exception_rate=args.exception_rate,
+                                   misalignment_rate=args.misalignment_rate, duplicate_rate=args.duplicate_rate,
+                                   seed=args.seed, previous_tax_ids=list(previous_records),
+                                   cross_period_duplicate_rate=args.cross_period_duplicate_rate)
+    records = {**previous_records, **records}
+    generate_seconds = time.perf_counter() - started
+    source_bytes = os.path.getsize(source_file)
+
+    provider = main.ConnectionProvider(lambda: StubCursor(records, args.latency))
+    main.connection_provider = provider
+    main.record_lookup = main.RecordLookup(batch_size=args.lookup_batch_size, workers=args.lookup_workers)
+    main.metrics_path = os.path.join(size_dir, 'metrics.jsonl')
+
+    if args.trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    status = 'completed'
+    try:
+        main.DataProcessor.process_data(directories['source'], directories['archive'], directories['exceptions'],
+                                        directories['output'], chunksize=args.chunksize)
+    except SystemExit:
+        status = 'failed'
+    total_seconds = time.perf_counter() - started
+    peak_traced_mb = None
+    if args.trace_memory:
+        peak_traced_mb = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+        tracemalloc.stop()
+
+    stages = []
+    if os.path.exists(main.metrics_path):
+        with open(main.metrics_path) as file:
+            file_metrics = [json.loads(line) for line in file]
+        stages = file_metrics[-1]['stages'] if file_metrics else []
+    result = {
+        'rows': rows,
+        'run_date': args.run_date,
+        'status': status,
+        'source_bytes': source_bytes,
+        'generate_seconds': round(generate_seconds, 4),
+        'process_data_seconds': round(total_seconds, 4),
+        'rows_per_second': round(rows / total_seconds, 1) if total_seconds else None,
+        'lookup_queries': sum(cursor.queries for cursor in provider.cursors),
+        'peak_traced_mb': peak_traced_mb,
+        'peak_rss_mb': main.peak_rss_mb(),
+        'stages': stages,
+    }
+    logging.info(f"Benchmark {rows} rows: {status} in {total_seconds:.2f}s")
+    return result
+
+
+def compare_results(current, previous_path):
+    with open(previous_path) as file:
+        previous = {result['rows']: result for result in json.load(file)['results']}
+    for result in current['results']:
+        baseline = previous.get(result['rows'])
+        if not baseline:
+            continue
+        change = (result['process_data_seconds'] - baseline['process_data_seconds']) / baseline['process_data_seconds'] * 100
+        print(f"{result['rows']:>9} rows: {baseline['process_data_seconds']:.2f}s -> {result['process_data_seconds']:.2f}s ({change:+.1f}%)")
+        for key in ('peak_traced_mb', 'peak_rss_mb'):
+            if baseline.get(key) is not None and result.get(key) is not None:
+                print(f"          {key:<28} {baseline[key]:.1f}MB -> {result[key]:.1f}MB")
+        baseline_stages = {stage['stage']: stage for stage in baseline['stages']}
+        for stage in result['stages']:
+            if stage['stage'] in baseline_stages:
+                before = baseline_stages[stage['stage']]
+                memory = ''
+                if before.get('peak_traced_mb') is not None and stage.get('peak_traced_mb') is not None:
+                    memory = f"  peak {before['peak_traced_mb']:.1f}MB -> {stage['peak_traced_mb']:.1f}MB"
+                print(f"          {stage['stage']:<28} {before['seconds']:.3f}s -> {stage['seconds']:.3f}s{memory}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark DataProcessor on synthetic county files.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help='Row counts to benchmark')
+    parser.add_argument('--output', type=str, default='benchmark_results.json', help='File to write the JSON results to')
+    parser.add_argument('--compare', type=str, default=None, help='Previous results file to compare against')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds of simulated latency per lookup query')
+    parser.add_argument('--exception_rate', type=float, default=0.05, help='Fraction of rows that should become exceptions')
+    parser.add_argument('--misalignment_rate', type=float, default=0.02, help='Fraction of rows with a split Line1 address')
+    parser.add_argument('--duplicate_rate', type=float, default=0.02, help='Fraction of rows repeated within the file')
+    parser.add_argument('--run_date', type=str, default=f"{datetime.now().year}-03-01",
+                        help='Run date (YYYY-MM-DD) of the timed file; outputs for the earlier periods of its year are generated first')
+    parser.add_argument('--previous_rows', type=int, default=None,
+                        help='Rows in each earlier-period file (defaults to the benchmarked size)')
+    parser.add_argument('--cross_period_duplicate_rate', type=float, default=0.02,
+                        help='Fraction of rows whose Tax ID already appeared in an earlier period')
+    parser.add_argument('--chunksize', type=int, default=None, help='Benchmark the streaming mode with this chunk size')
+    parser.add_argument('--lookup_batch_size', type=int, default=1000, help='Number of Tax IDs per lookup query')
+    parser.add_argument('--lookup_workers', type=int, default=1, help='Number of stub connections used for lookups')
+    parser.add_argument('--trace_memory', action='store_true', help='Record tracemalloc peaks for the run and each stage')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the generated files')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated files and outputs')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    work_dir = tempfile.mkdtemp(prefix='dataprocessor_benchmark_')
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), filename=os.path.join(work_dir, 'benchmark.log'),
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        results = [benchmark_size(rows, work_dir, args) for rows in args.sizes]
+    finally:
+        if args.keep:
+            print(f"Benchmark files kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'keep')},
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Benchmark results written to {args.output}")
+    for result in results:
+        print(f"{result['rows']:>9} rows: {result['process_data_seconds']:.2f}s ({result['rows_per_second']} rows/s, {result['status']})")
+    if args.compare:
+        compare_results(report, args.compare)
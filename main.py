@@ -7,66 +7,1139 @@
 # 
 #----------------------------------------------------------
 import pandas as pd
+import numpy as np
+import re
 import shutil
+import sys
 import logging
 import os
 from datetime import datetime
 from glob import glob
 from tqdm import tqdm
 import argparse
+import csv
+import errno
+import hashlib
+import io
+import cProfile
+import json
+import multiprocessing
+import queue
+import sqlite3
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from logging.handlers import QueueHandler, QueueListener
 from Common import ConnectionHelper
 from Common import GlobalConfig
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+metrics_path = None
+
 def setup(logs_directory):
+    global metrics_path
     os.makedirs(logs_directory, exist_ok=True)
     current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     log_filename = f"{logs_directory}/dataprocessor_{current_time}.log"
+    metrics_path = f"{logs_directory}/dataprocessor_{current_time}_metrics.jsonl"
     log_level = os.getenv('LOG_LEVEL', 'INFO').upper()
     logging.basicConfig(level=log_level, filename=log_filename, filemode='a',
                         format='%(asctime)s - %(levelname)s - %(message)s')
     logging.info("Logging is configured.")
     pd.set_option('display.max_columns', None)
+    return log_filename
 
-def db_connection():
+def db_connection(environment="dev"):
     try:
-        environment = "dev"  # "prod"
         spark_dsn = GlobalConfig.spark_dsns[environment]
         spark_username = GlobalConfig.spark_users[environment]
         spark_password = GlobalConfig.spark_password(spark_username)
         odbc_connection, odbc_cursor = ConnectionHelper.GetSparkOdbcConnection(spark_dsn, spark_username, spark_password, GlobalConfig.email_info)
+        logging.info(f"Connected to database spark environment {environment}.")
         return odbc_cursor
     except Exception as e:
         logging.error(f"Failed to connect to database spark environment: {e}")
-        exit(1)
+        raise
+
+
+class ConnectionProvider:
+
+    def __init__(self, open_cursor):
+        self.open_cursor = open_cursor
+        self.cursors = []
+
+    def get_cursors(self, count=1):
+        while len(self.cursors) < count:
+            self.cursors.append(self.open_cursor())
+        return self.cursors[:count]
+
+    @staticmethod
+    def spark(environment=None):
+        environment = environment or os.getenv('DATAPROCESSOR_ENVIRONMENT', 'dev')
+        return ConnectionProvider(lambda: db_connection(environment))
+
+    @staticmethod
+    def reference_table(path):
+        records = ReferenceTableCursor.load(path)
+        return ConnectionProvider(lambda: ReferenceTableCursor(records))
+
+
+class ReferenceTableCursor:
+
+    COLUMNS = ['SSN', 'FIRST_NAME', 'LAST_NAME', 'MID_NAME']
+
+    def __init__(self, records):
+        self.records = records
+        self.description = [(column,) for column in self.COLUMNS]
+        self.rows = []
+
+    @staticmethod
+    def load(path):
+        try:
+            if path.lower().endswith('.csv'):
+                table = pd.read_csv(path, dtype=str, keep_default_na=False)
+            else:
+                with sqlite3.connect(path) as connection:
+                    table = pd.read_sql_query("SELECT * FROM tax_id_reference", connection)
+            table.columns = [column.upper() for column in table.columns]
+            records = {}
+            for row in table[ReferenceTableCursor.COLUMNS].itertuples(index=False, name=None):
+                records.setdefault(str(row[0]), []).append(row)
+            logging.info(f"Loaded {len(table)} reference records from {path}.")
+            return records
+        except Exception as e:
+            logging.error(f"Method Failed: ReferenceTableCursor.load, Error: {e}")
+            raise
+
+    def execute(self, query, params=None):
+        self.rows = [row for tax_id in params or [] for row in self.records.get(str(tax_id), [])]
+        return self
+
+    def fetchmany(self, size=1):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+connection_provider = None
+
+def get_connection_provider():
+    global connection_provider
+    if connection_provider is None:
+        connection_provider = ConnectionProvider.spark()
+    return connection_provider
+
+def configure_connection(environment=None, reference_table=None):
+    global connection_provider
+    if reference_table:
+        connection_provider = ConnectionProvider.reference_table(reference_table)
+    else:
+        connection_provider = ConnectionProvider.spark(environment)
+    return connection_provider
+
+EXCEPTION_KEYWORDS = ("CENTER", "INC", "LLC", "CARE", "COMMONS", "OFFICE", "KIDS",
+                      "LEARNING", "RANCH", "APARTMENTS", "KIDZ", "PROPERTIES", "BRIDGE",
+                      "CLUB", "LP", "FRIENDS", "PRESCHOOL", "PARK", "KNOWLEDGE", "PORTSIDE",
+                      "PROPERTY", "ADVANCED", "WORLD", "MONTESS", "ACADEMY", "PETITE",
+                      "HONEST", "INVESTMENT", "SCHOOL", "PLAYHOUSE", "TYMES", "PLAYSCHOOL",
+                      "DAYCARE", "COUNTRY", "VILLA", "WAKING", "MONTESSORI")
+
+DEFAULT_EXCEPTION_RULES = [
+    {"name": "organisation_keyword", "column": "Organization First Name", "match": "substring",
+     "values": list(EXCEPTION_KEYWORDS), "case_sensitive": False, "comment": " This is an Organisation TaxID."},
+    {"name": "missing_line1_address", "column": "Organization Street Line1 Address", "match": "empty",
+     "comment": " Missing Line1 Address."},
+    {"name": "invalid_tax_id", "column": "Tax ID", "comment": " Invalid Tax ID or Tax ID not found in database.",
+     "any": [{"match": "substring", "values": ["-"]}, {"match": "db_miss"}]},
+]
+
+
+class ExceptionRule:
+
+    MATCH_TYPES = ('substring', 'regex', 'empty', 'db_miss')
+
+    def __init__(self, name, column, comment, matchers):
+        self.name = name
+        self.column = column
+        self.comment = comment
+        self.matchers = matchers
+
+    @staticmethod
+    def compile(spec):
+        name = spec.get('name')
+        try:
+            if not name or 'column' not in spec or 'comment' not in spec:
+                raise ValueError("every rule needs a name, a column and a comment")
+            conditions = spec['any'] if 'any' in spec else [spec]
+            matchers = [ExceptionRule.compile_matcher(condition.get('column', spec['column']), condition)
+                        for condition in conditions]
+            return ExceptionRule(name, spec['column'], spec['comment'], matchers)
+        except Exception as e:
+            raise ValueError(f"Invalid exception rule {name!r}: {e}") from e
+
+    @staticmethod
+    def compile_matcher(column, condition):
+        match = condition.get('match')
+        case_sensitive = condition.get('case_sensitive', True)
+        if match == 'substring':
+            values = [value if case_sensitive else value.upper() for value in condition['values']]
+            if not values:
+                raise ValueError("substring rules need at least one value")
+            # One alternation regex scans each value once, longest keyword first.
+            pattern = re.compile('|'.join(re.escape(value) for value in sorted(set(values), key=len, reverse=True)))
+            return lambda data, db_keys: ExceptionRule.text(data[column], case_sensitive).str.contains(pattern, regex=True)
+        if match == 'regex':
+            pattern = re.compile(condition['pattern'], 0 if case_sensitive else re.IGNORECASE)
+            return lambda data, db_keys: data[column].astype(str).str.contains(pattern, regex=True)
+        if match == 'empty':
+            return lambda data, db_keys: data[column].isna() | data[column].astype(str).str.strip().eq('')
+        if match == 'db_miss':
+            return lambda data, db_keys: ~data[column].astype(str).isin(db_keys)
+        raise ValueError(f"unknown match type {match!r}, expected one of {', '.join(ExceptionRule.MATCH_TYPES)}")
+
+    @staticmethod
+    def text(values, case_sensitive):
+        values = values.astype(str)
+        return values if case_sensitive else values.str.upper()
+
+    def evaluate(self, data, db_keys):
+        hits = self.matchers[0](data, db_keys)
+        for matcher in self.matchers[1:]:
+            hits = hits | matcher(data, db_keys)
+        return hits
+
+
+class ExceptionRules:
+
+    def __init__(self, rules):
+        self.rules = rules
+
+    @staticmethod
+    def default():
+        return ExceptionRules([ExceptionRule.compile(spec) for spec in DEFAULT_EXCEPTION_RULES])
+
+    @staticmethod
+    def load(path):
+        try:
+            with open(path) as file:
+                if path.lower().endswith(('.yaml', '.yml')):
+                    if yaml is None:
+                        raise ImportError("PyYAML is required for YAML rule files, use JSON instead")
+                    config = yaml.safe_load(file)
+                else:
+                    config = json.load(file)
+            specs = [] if config.get('replace_defaults') else list(DEFAULT_EXCEPTION_RULES)
+            specs.extend(config.get('rules', []))
+            names = [spec.get('name') for spec in specs]
+            duplicates = sorted({name for name in names if names.count(name) > 1})
+            if duplicates:
+                raise ValueError(f"Duplicate rule names: {', '.join(duplicates)}")
+            rules = ExceptionRules([ExceptionRule.compile(spec) for spec in specs])
+            logging.info(f"Loaded {len(rules.rules)} exception rules from {path}.")
+            return rules
+        except Exception as e:
+            logging.error(f"Method Failed: ExceptionRules.load, Error: {e}")
+            raise
+
+    def evaluate(self, data, db_keys, metrics):
+        exception = np.zeros(len(data), dtype=bool)
+        comments = pd.Series('', index=data.index, dtype=object)
+        for rule in self.rules:
+            with metrics.stage(f'rule:{rule.name}', rows_in=len(data)) as stage:
+                hits = rule.evaluate(data, db_keys).to_numpy(dtype=bool)
+                stage.rows_out = int(hits.sum())
+            metrics.count(f'rule_hits:{rule.name}', stage.rows_out)
+            exception |= hits
+            comments = comments + DataProcessor._comment_column(pd.Series(hits, index=data.index), rule.comment)
+        return pd.Series(exception, index=data.index), comments
+
+
+exception_rules = None
+
+def configure_rules(rules_path=None):
+    global exception_rules
+    exception_rules = ExceptionRules.load(rules_path) if rules_path else ExceptionRules.default()
+    return exception_rules
+
+def get_exception_rules():
+    if exception_rules is None:
+        configure_rules()
+    return exception_rules
+
+SPECIAL_CHARACTERS = '[,.#]'
+# Amounts keep their stripping so values such as "$1,234.00" render exactly as before.
+SPECIAL_CHARACTER_COLUMNS = ('Organization First Name', 'Organization Middle Name', 'Organization Last Name',
+                             'Organization Street Line1 Address', 'Organization Street Line2 Address',
+                             'Organization City', 'Organization State', 'Organization Zip code', 'Amount of Contract')
+CATEGORY_MAX_RATIO = 0.5
+NULL_HASH = np.uint64(0x9E3779B97F4A7C15)
+
+class LookupCache:
+
+    def __init__(self, cache_path, ttl_days=30):
+        self.cache_path = cache_path
+        self.ttl_seconds = ttl_days * 86400
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.connection = sqlite3.connect(cache_path, timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS tax_id_records (
+                                       ssn TEXT PRIMARY KEY,
+                                       records TEXT NOT NULL,
+                                       fetched_at REAL NOT NULL)""")
+        self.connection.commit()
+
+    def get_many(self, tax_ids, batch_size=500):
+        try:
+            cutoff = time.time() - self.ttl_seconds
+            cached = {}
+            with self.lock:
+                for start in range(0, len(tax_ids), batch_size):
+                    chunk = tax_ids[start:start + batch_size]
+                    placeholders = ', '.join('?' * len(chunk))
+                    rows = self.connection.execute(
+                        f"SELECT ssn, records FROM tax_id_records WHERE fetched_at >= ? AND ssn IN ({placeholders})",
+                        [cutoff] + chunk)
+                    for ssn, records in rows:
+                        cached[ssn] = json.loads(records)
+            return cached
+        except Exception as e:
+            logging.error(f"Method Failed: LookupCache.get_many, Error: {e}")
+            raise
+
+    def put_many(self, records):
+        try:
+            grouped = {}
+            for record in records:
+                grouped.setdefault(str(record['SSN']), []).append(record)
+            fetched_at = time.time()
+            with self.lock:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO tax_id_records (ssn, records, fetched_at) VALUES (?, ?, ?)",
+                    [(ssn, json.dumps(ssn_records, default=str), fetched_at) for ssn, ssn_records in grouped.items()])
+                self.connection.commit()
+        except Exception as e:
+            logging.error(f"Method Failed: LookupCache.put_many, Error: {e}")
+            raise
+
+    def close(self):
+        self.connection.close()
+
+
+class LookupCheckpoint:
+
+    # Only used with --resume: keeps the lookups of files that have not been archived yet so a rerun
+    # after a failure does not query Spark again. Rows are deleted as soon as their file is archived.
+
+    def __init__(self, checkpoint_path, ttl_hours=24):
+        self.checkpoint_path = checkpoint_path
+        self.ttl_seconds = ttl_hours * 3600
+        checkpoint_dir = os.path.dirname(checkpoint_path)
+        if checkpoint_dir:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+        self.connection = sqlite3.connect(checkpoint_path, timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS lookup_checkpoint (
+                                       source_file TEXT NOT NULL,
+                                       ssn TEXT NOT NULL,
+                                       records TEXT NOT NULL,
+                                       fetched_at REAL NOT NULL,
+                                       PRIMARY KEY (source_file, ssn))""")
+        self.connection.commit()
+
+    def get_many(self, source_file, tax_ids, batch_size=500):
+        try:
+            cutoff = time.time() - self.ttl_seconds
+            checkpointed = {}
+            with self.lock:
+                for start in range(0, len(tax_ids), batch_size):
+                    chunk = tax_ids[start:start + batch_size]
+                    placeholders = ', '.join('?' * len(chunk))
+                    rows = self.connection.execute(
+                        f"SELECT ssn, records FROM lookup_checkpoint "
+                        f"WHERE source_file = ? AND fetched_at >= ? AND ssn IN ({placeholders})",
+                        [source_file, cutoff] + chunk)
+                    for ssn, records in rows:
+                        checkpointed[ssn] = json.loads(records)
+            return checkpointed
+        except Exception as e:
+            logging.error(f"Method Failed: LookupCheckpoint.get_many, Error: {e}")
+            raise
+
+    def put_many(self, source_file, records):
+        try:
+            grouped = {}
+            for record in records:
+                grouped.setdefault(str(record['SSN']), []).append(record)
+            fetched_at = time.time()
+            with self.lock:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO lookup_checkpoint (source_file, ssn, records, fetched_at) VALUES (?, ?, ?, ?)",
+                    [(source_file, ssn, json.dumps(ssn_records, default=str), fetched_at)
+                     for ssn, ssn_records in grouped.items()])
+                self.connection.commit()
+        except Exception as e:
+            logging.error(f"Method Failed: LookupCheckpoint.put_many, Error: {e}")
+            raise
+
+    def purge(self, source_file):
+        try:
+            with self.lock:
+                self.connection.execute("DELETE FROM lookup_checkpoint WHERE source_file = ?", (source_file,))
+                self.connection.commit()
+        except Exception as e:
+            logging.error(f"Method Failed: LookupCheckpoint.purge, Error: {e}")
+            raise
+
+    def close(self):
+        self.connection.close()
+
+
+class RecordLookup:
+
+    QUERY = """SELECT pers.ssn, pers.first_name, pers.last_name, pers.mid_name
+               FROM edr.org org
+               JOIN edr.pers pers ON org.tax_num_identif = pers.ssn
+               WHERE org.tax_num_identif IN ({placeholders});"""
+
+    def __init__(self, cursors=None, batch_size=1000, fetch_size=5000, cache=None, workers=1, checkpoint=None):
+        if cursors is not None and not cursors:
+            raise ValueError("RecordLookup requires at least one cursor.")
+        self.cursors = None
+        if cursors is not None:
+            self.cursors = queue.Queue()
+            for cursor in cursors:
+                self.cursors.put(cursor)
+        self.workers = len(cursors) if cursors is not None else workers
+        self.batch_size = batch_size
+        self.fetch_size = fetch_size
+        self.cache = cache
+        self.checkpoint = checkpoint
+
+    def lookup(self, tax_ids, source_file=None):
+        try:
+            tax_ids = list(dict.fromkeys(str(tax_id) for tax_id in tax_ids))
+            cached = self.cache.get_many(tax_ids) if self.cache else {}
+            checkpointed = self.checkpoint is not None and source_file is not None
+            if checkpointed:
+                cached.update(self.checkpoint.get_many(source_file, [tax_id for tax_id in tax_ids if tax_id not in cached]))
+            pending = [tax_id for tax_id in tax_ids if tax_id not in cached]
+            chunks = [pending[start:start + self.batch_size] for start in range(0, len(pending), self.batch_size)]
+            logging.info(f"Looking up {len(pending)} Tax IDs in {len(chunks)} batches ({len(cached)} served from cache).")
+            if chunks and self.cursors is None:
+                self.cursors = queue.Queue()
+                for cursor in get_connection_provider().get_cursors(self.workers):
+                    self.cursors.put(cursor)
+
+            if self.workers > 1 and len(chunks) > 1:
+                with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                    fetched = list(executor.map(self._fetch_chunk, chunks))
+            else:
+                fetched = [self._fetch_chunk(chunk) for chunk in chunks]
+
+            results = [record for ssn_records in cached.values() for record in ssn_records]
+            for records in fetched:
+                results.extend(records)
+                if self.cache:
+                    self.cache.put_many(records)
+                if checkpointed:
+                    self.checkpoint.put_many(source_file, records)
+            return results
+        except Exception as e:
+            logging.error(f"Method Failed: RecordLookup.lookup, Error: {e}")
+            raise
+
+    def _fetch_chunk(self, chunk):
+        cursor = self.cursors.get()
+        try:
+            query = self.QUERY.format(placeholders=', '.join('?' * len(chunk)))
+            result = cursor.execute(query, chunk)
+            columns = [col[0] for col in result.description]
+            records = []
+            while True:
+                rows = result.fetchmany(self.fetch_size)
+                if not rows:
+                    break
+                records.extend(dict(zip(columns, row)) for row in rows)
+            return records
+        finally:
+            self.cursors.put(cursor)
+
+    def purge_checkpoint(self, source_file):
+        if self.checkpoint is not None:
+            self.checkpoint.purge(source_file)
+
+
+record_lookup = RecordLookup()
+
+def configure_lookup(lookup_workers=1, batch_size=1000, cache_path=None, cache_ttl_days=30, environment=None, reference_table=None,
+                     checkpoint_path=None, checkpoint_ttl_hours=24):
+    global record_lookup
+    configure_connection(environment, reference_table)
+    record_lookup = RecordLookup(batch_size=batch_size,
+                                 cache=LookupCache(cache_path, cache_ttl_days) if cache_path else None,
+                                 workers=lookup_workers,
+                                 checkpoint=LookupCheckpoint(checkpoint_path, checkpoint_ttl_hours) if checkpoint_path else None)
+    return record_lookup
+
+run_manifest = None
+resume_run = False
+
+def configure_manifest(manifest_path=None, resume=False):
+    global run_manifest, resume_run
+    run_manifest = RunManifest(manifest_path) if manifest_path else None
+    resume_run = resume
+    return run_manifest
+
+def _init_worker(log_queue, log_level, lookup_options, manifest_options, rules_path, run_metrics_path):
+    global metrics_path
+    metrics_path = run_metrics_path
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(QueueHandler(log_queue))
+    root_logger.setLevel(log_level)
+    configure_lookup(**lookup_options)
+    configure_manifest(**manifest_options)
+    configure_rules(rules_path)
+
+def _process_file_task(file, directory, archive_dir, exception_dir, output_dir, chunksize):
+    try:
+        DataProcessor.process_source_file(file, directory, archive_dir, exception_dir, output_dir, chunksize)
+        return None
+    except Exception as e:
+        logging.error(f"Processing failed for {file}: {e}", exc_info=True)
+        return str(e) or type(e).__name__
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def current_rss_mb():
+    # ru_maxrss is a high-water mark for the whole process, so stage deltas need the current resident size.
+    try:
+        with open('/proc/self/statm') as file:
+            resident_pages = int(file.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+class StageTimer:
+
+    def __init__(self, metrics, name, rows_in=None):
+        self.metrics = metrics
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.traced_peak = 0
+        self.rss_delta = None
+        self.discarded = False
+
+    def __enter__(self):
+        if self.metrics.trace_stages and tracemalloc.is_tracing():
+            if self.metrics.active:
+                parent = self.metrics.active[-1]
+                parent.traced_peak = max(parent.traced_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self.metrics.active.append(self)
+        self.rss_before = current_rss_mb()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.started
+        rss_after = current_rss_mb()
+        if self.rss_before is not None and rss_after is not None:
+            self.rss_delta = rss_after - self.rss_before
+        self.metrics.active.pop()
+        if self.metrics.trace_stages and tracemalloc.is_tracing():
+            self.traced_peak = max(self.traced_peak, tracemalloc.get_traced_memory()[1])
+            if self.metrics.active:
+                parent = self.metrics.active[-1]
+                parent.traced_peak = max(parent.traced_peak, self.traced_peak)
+        if not self.discarded:
+            self.metrics.record(self, seconds)
+        return False
+
+
+class PipelineMetrics:
+
+    def __init__(self, source_file, trace_stages=True):
+        self.source_file = source_file
+        self.trace_stages = trace_stages
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.active = []
+
+    def stage(self, name, rows_in=None):
+        return StageTimer(self, name, rows_in)
+
+    def timed_iter(self, name, iterable):
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name) as stage:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    stage.discarded = True
+                    return
+                stage.rows_out = len(item)
+            yield item
+
+    def count(self, name, value):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, timer, seconds):
+        stage = self.stages.setdefault(timer.name, {'stage': timer.name, 'calls': 0, 'seconds': 0.0, 'rows_in': None,
+                                                    'rows_out': None, 'peak_traced_mb': None, 'rss_delta_mb': None})
+        stage['calls'] += 1
+        stage['seconds'] += seconds
+        for key, value in (('rows_in', timer.rows_in), ('rows_out', timer.rows_out)):
+            if value is not None:
+                stage[key] = (stage[key] or 0) + value
+        if self.trace_stages and tracemalloc.is_tracing():
+            stage['peak_traced_mb'] = max(stage['peak_traced_mb'] or 0, round(timer.traced_peak / (1024 * 1024), 1))
+        if timer.rss_delta is not None:
+            # Largest change in resident memory over a single call; the run-level peak is in the summary.
+            rss_delta_mb = round(timer.rss_delta, 1)
+            stage['rss_delta_mb'] = rss_delta_mb if stage['rss_delta_mb'] is None else max(stage['rss_delta_mb'], rss_delta_mb)
+
+    def summary(self, status, error=None):
+        stages = []
+        for stage in self.stages.values():
+            stage = dict(stage, seconds=round(stage['seconds'], 4))
+            if stage['rows_out'] and stage['seconds'] > 0:
+                stage['rows_per_second'] = round(stage['rows_out'] / stage['seconds'], 1)
+            stages.append(stage)
+        return {
+            'source_file': self.source_file,
+            'started_at': self.started_at,
+            'status': status,
+            'error': error,
+            'seconds': round(time.perf_counter() - self.started, 4),
+            'peak_rss_mb': peak_rss_mb(),
+            'counters': self.counters,
+            'stages': stages,
+        }
+
+    def write(self, path, status, error=None):
+        try:
+            if path is None:
+                return
+            with open(path, 'a') as file:
+                file.write(json.dumps(self.summary(status, error)) + '\n')
+        except Exception as e:
+            logging.error(f"Method Failed: PipelineMetrics.write, Error: {e}")
+
+
+class RunManifest:
+
+    STAGES = ('started', 'written', 'archived')
+
+    def __init__(self, manifest_path):
+        manifest_dir = os.path.dirname(manifest_path)
+        if manifest_dir:
+            os.makedirs(manifest_dir, exist_ok=True)
+        self.connection = sqlite3.connect(manifest_path, timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS run_manifest (
+                                       source_file TEXT PRIMARY KEY,
+                                       content_hash TEXT NOT NULL,
+                                       stage TEXT NOT NULL,
+                                       output_paths TEXT,
+                                       counts TEXT,
+                                       error TEXT,
+                                       updated_at TEXT NOT NULL)""")
+        self.connection.commit()
+
+    @staticmethod
+    def file_hash(path, block_size=1024 * 1024):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(block_size), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def get(self, source_file):
+        with self.lock:
+            row = self.connection.execute("""SELECT content_hash, stage, output_paths, counts, error FROM run_manifest
+                                             WHERE source_file = ?""", (os.path.abspath(source_file),)).fetchone()
+        if row is None:
+            return None
+        content_hash, stage, output_paths, counts, error = row
+        return {'content_hash': content_hash, 'stage': stage, 'output_paths': json.loads(output_paths or '[]'),
+                'counts': json.loads(counts or '{}'), 'error': error}
+
+    def record(self, source_file, content_hash, stage, output_paths=None, counts=None, error=None):
+        try:
+            with self.lock, self.connection:
+                self.connection.execute("""INSERT INTO run_manifest (source_file, content_hash, stage, output_paths, counts, error, updated_at)
+                                           VALUES (?, ?, ?, ?, ?, ?, ?)
+                                           ON CONFLICT (source_file) DO UPDATE SET
+                                               content_hash = excluded.content_hash,
+                                               stage = excluded.stage,
+                                               output_paths = COALESCE(excluded.output_paths, output_paths),
+                                               counts = COALESCE(excluded.counts, counts),
+                                               error = excluded.error,
+                                               updated_at = excluded.updated_at""",
+                                        (os.path.abspath(source_file), content_hash, stage,
+                                         json.dumps(output_paths) if output_paths is not None else None,
+                                         json.dumps(counts) if counts is not None else None,
+                                         error, datetime.now().isoformat(timespec='seconds')))
+        except Exception as e:
+            logging.error(f"Method Failed: RunManifest.record, Error: {e}")
+            raise
+
+    def close(self):
+        self.connection.close()
+
+
+class FileCheckpoint:
+
+    def __init__(self, manifest, source_file, verify=False):
+        # Only a resumed run needs the hash before reading; otherwise it is taken from the SourceReader read.
+        self.manifest = manifest
+        self.source_file = source_file
+        self.content_hash = RunManifest.file_hash(source_file) if manifest and verify else None
+        self.entry = manifest.get(source_file) if manifest and verify else None
+        if self.entry and self.entry['content_hash'] != self.content_hash:
+            logging.info(f"Content of {source_file} changed since the last run, ignoring its manifest entry.")
+            self.entry = None
+
+    def set_content_hash(self, content_hash):
+        if self.content_hash is None:
+            self.content_hash = content_hash
+
+    def completed(self, stage):
+        if not self.entry:
+            return False
+        return RunManifest.STAGES.index(self.entry['stage']) >= RunManifest.STAGES.index(stage)
+
+    def outputs_exist(self):
+        return bool(self.entry and self.entry['output_paths']) and all(os.path.exists(path) for path in self.entry['output_paths'])
+
+    def mark(self, stage, output_paths=None, counts=None, error=None):
+        entry = dict(self.entry or {'output_paths': [], 'counts': {}})
+        entry.update(content_hash=self.content_hash or '', stage=stage, error=error)
+        if output_paths is not None:
+            entry['output_paths'] = output_paths
+        if counts is not None:
+            entry['counts'] = counts
+        self.entry = entry
+        if self.manifest:
+            self.manifest.record(self.source_file, self.content_hash or '', stage, output_paths, counts, error)
+
+    def fail(self, error):
+        if self.manifest:
+            stage = self.entry['stage'] if self.entry else 'started'
+            self.manifest.record(self.source_file, self.content_hash or '', stage, error=error)
+
+
+class PicIndex:
+
+    INDEX_FILE = 'pic_index.sqlite'
+
+    def __init__(self, year_dir):
+        self.year_dir = year_dir
+        os.makedirs(year_dir, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(year_dir, self.INDEX_FILE), timeout=30)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS pic_periods (
+                                       family TEXT NOT NULL,
+                                       period TEXT NOT NULL,
+                                       size INTEGER NOT NULL,
+                                       mtime_ns INTEGER NOT NULL,
+                                       PRIMARY KEY (family, period))""")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS pic_keys (
+                                       family TEXT NOT NULL,
+                                       period TEXT NOT NULL,
+                                       pic TEXT NOT NULL,
+                                       PRIMARY KEY (family, period, pic)) WITHOUT ROWID""")
+        self.connection.commit()
+
+    @staticmethod
+    def for_output_dir(output_dir):
+        return PicIndex(os.path.join(output_dir, datetime.now().strftime('%Y')))
+
+    @staticmethod
+    def split_output_name(output_name):
+        family, month, day, year = output_name.rsplit('_', 3)
+        return family, f"{month}_{day}_{year}"
+
+    @staticmethod
+    def read_output_keys(output_path):
+        with open(output_path, 'r') as file:
+            next(file, None)
+            previous_line = next(file, None)
+            for line in file:
+                key = previous_line[:12].strip(' \t\n')
+                if key:
+                    yield key
+                previous_line = line
+
+    def index_output(self, family, period, output_path):
+        try:
+            stat = os.stat(output_path)
+            with self.connection:
+                self.connection.execute("DELETE FROM pic_keys WHERE family = ? AND period = ?", (family, period))
+                self.connection.executemany("INSERT OR IGNORE INTO pic_keys (family, period, pic) VALUES (?, ?, ?)",
+                                            ((family, period, key) for key in PicIndex.read_output_keys(output_path)))
+                self.connection.execute("INSERT OR REPLACE INTO pic_periods (family, period, size, mtime_ns) VALUES (?, ?, ?, ?)",
+                                        (family, period, stat.st_size, stat.st_mtime_ns))
+            logging.debug(f"Indexed PIC keys of {output_path} for {family} {period}.")
+        except Exception as e:
+            logging.error(f"Method Failed: PicIndex.index_output, Error: {e}")
+            raise
+
+    def ensure_indexed(self, family, period, output_path):
+        stat = os.stat(output_path)
+        row = self.connection.execute("SELECT size, mtime_ns FROM pic_periods WHERE family = ? AND period = ?",
+                                      (family, period)).fetchone()
+        if row != (stat.st_size, stat.st_mtime_ns):
+            logging.info(f"PIC index is missing or stale for {output_path}, indexing it.")
+            self.index_output(family, period, output_path)
+
+    def rebuild(self):
+        try:
+            with self.connection:
+                self.connection.execute("DELETE FROM pic_keys")
+                self.connection.execute("DELETE FROM pic_periods")
+            indexed = 0
+            for output_path in sorted(glob(os.path.join(self.year_dir, 'output_*.txt'))):
+                output_name = os.path.basename(output_path)[len('output_'):-len('.txt')]
+                try:
+                    family, period = PicIndex.split_output_name(output_name)
+                    datetime.strptime(period, '%b_%d_%y')
+                except ValueError:
+                    logging.warning(f"Skipping {output_path}: name does not match output_<family>_<MON>_<DD>_<YY>.txt")
+                    continue
+                self.index_output(family, period, output_path)
+                indexed += 1
+            logging.info(f"Rebuilt PIC index in {self.year_dir} from {indexed} output files.")
+        except Exception as e:
+            logging.error(f"Method Failed: PicIndex.rebuild, Error: {e}")
+            raise
+
+    def view(self, family, periods):
+        return PicIndexView(self, family, periods)
+
+    def has_keys(self, family, periods):
+        placeholders = ', '.join('?' * len(periods))
+        row = self.connection.execute(f"SELECT 1 FROM pic_keys WHERE family = ? AND period IN ({placeholders}) LIMIT 1",
+                                      [family] + periods).fetchone()
+        return row is not None
+
+    def find(self, family, periods, keys, batch_size=500):
+        found = set()
+        placeholders = ', '.join('?' * len(periods))
+        for start in range(0, len(keys), batch_size):
+            chunk = keys[start:start + batch_size]
+            rows = self.connection.execute(
+                f"SELECT DISTINCT pic FROM pic_keys WHERE family = ? AND period IN ({placeholders}) AND pic IN ({', '.join('?' * len(chunk))})",
+                [family] + periods + chunk)
+            found.update(pic for pic, in rows)
+        return found
+
+    def close(self):
+        self.connection.close()
+
+
+class PicIndexView:
+
+    def __init__(self, pic_index, family, periods):
+        self.pic_index = pic_index
+        self.family = family
+        self.periods = list(periods)
+        self.empty = not self.periods or not pic_index.has_keys(self.family, self.periods)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def contains_mask(self, values):
+        found = self.pic_index.find(self.family, self.periods, values.astype(str).unique().tolist())
+        return values.isin(found)
+
+    def close(self):
+        self.pic_index.close()
+
+
+class HashingReader(io.RawIOBase):
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.digest = hashlib.sha256()
 
-odbc_cursor = db_connection()
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self.raw.readinto(buffer)
+        if count:
+            self.digest.update(memoryview(buffer)[:count])
+        return count
+
+    def close(self):
+        self.raw.close()
+        super().close()
+
+
+class SourceReader:
+
+    PREAMBLE_LINES = 5
+    BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, source_file_path):
+        self.path = source_file_path
+        self.content_hash = None
+        self.open()
+        try:
+            self.preamble = SourceReader.read_lines(self.handle, SourceReader.PREAMBLE_LINES)
+            header = SourceReader.read_lines(self.handle, 1)
+            self.columns = SourceReader.column_names(next(csv.reader(header))) if header else []
+        except Exception:
+            self.handle.close()
+            raise
+
+    def open(self):
+        # The file is hashed for the run manifest as it is parsed, so it is only read once.
+        self.hashing = HashingReader(open(self.path, 'rb', buffering=0))
+        self.handle = io.BufferedReader(self.hashing, SourceReader.BUFFER_SIZE)
+
+    def reopen(self):
+        self.handle.close()
+        self.open()
+        SourceReader.read_lines(self.handle, SourceReader.PREAMBLE_LINES + 1)
+
+    def __str__(self):
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None and not self.handle.closed:
+            while self.handle.read(SourceReader.BUFFER_SIZE):
+                pass
+            self.content_hash = self.hashing.digest.hexdigest()
+        self.close()
+
+    @staticmethod
+    def read_lines(handle, count):
+        lines = []
+        for _ in range(count):
+            line = handle.readline()
+            if not line:
+                break
+            lines.append(line.decode('utf-8').rstrip('\r\n'))
+        return lines
+
+    @staticmethod
+    def scan_preamble(source_file_path):
+        with open(source_file_path, 'rb') as handle:
+            return SourceReader.read_lines(handle, SourceReader.PREAMBLE_LINES)
+
+    @staticmethod
+    def column_names(fields):
+        # Same names pandas infers from the header row, so rename_unnamed_columns sees 'Unnamed: <n>'.
+        names, seen = [], {}
+        for index, field in enumerate(fields):
+            name = field or f"Unnamed: {index}"
+            if name in seen:
+                seen[name] += 1
+                name = f"{name}.{seen[name]}"
+            else:
+                seen[name] = 0
+            names.append(name)
+        return names
+
+    def read_options(self):
+        return {'header': None, 'names': self.columns, 'dtype': str, 'keep_default_na': False, 'na_filter': False}
+
+    def read(self):
+        if not self.columns:
+            return pd.DataFrame()
+        if pyarrow is not None:
+            try:
+                return pd.read_csv(self.handle, engine='pyarrow', **self.read_options())
+            except Exception as e:
+                logging.warning(f"pyarrow could not parse {self.path}, falling back to the default engine: {e}")
+                self.reopen()
+        try:
+            return pd.read_csv(self.handle, **self.read_options())
+        except pd.errors.ParserError as e:
+            raise self.file_line_error(e) from e
+
+    def read_chunks(self, chunksize):
+        if not self.columns:
+            return
+        try:
+            with pd.read_csv(self.handle, chunksize=chunksize, **self.read_options()) as reader:
+                yield from reader
+        except pd.errors.ParserError as e:
+            raise self.file_line_error(e) from e
+
+    def file_line_error(self, error):
+        # pandas counts lines from the first data row; report them from the top of the file like the operators expect.
+        offset = SourceReader.PREAMBLE_LINES + 1
+        message = re.sub(r'\bline (\d+)', lambda match: f"line {int(match.group(1)) + offset}", str(error))
+        return type(error)(message)
+
+    def close(self):
+        self.handle.close()
+
+
+class ChunkedOutputWriter:
+
+    def __init__(self, output_paths, exception_path):
+        self.output_paths = output_paths
+        self.output_files = [open(f"{path}.tmp", 'w') for path in output_paths]
+        self.exception_path = exception_path
+        self.exception_temp_path = f"{exception_path}.tmp"
+        self.duplicates_path = f"{exception_path}.duplicates"
+        self.exception_columns = None
+
+    def write_records(self, records):
+        for file in self.output_files:
+            file.write(records)
+
+    def write_exceptions(self, exceptions, duplicates):
+        if self.exception_columns is None:
+            self.exception_columns = exceptions.columns
+            exceptions.to_csv(self.exception_temp_path, index=False)
+        else:
+            exceptions.to_csv(self.exception_temp_path, index=False, mode='a', header=False)
+        if not duplicates.empty:
+            duplicates = duplicates.reindex(columns=self.exception_columns)
+            duplicates.to_csv(self.duplicates_path, index=False, mode='a', header=False)
+
+    def finish(self):
+        if os.path.exists(self.duplicates_path):
+            with open(self.exception_temp_path, 'a') as target, open(self.duplicates_path) as source:
+                shutil.copyfileobj(source, target)
+        for file in self.output_files:
+            file.close()
+        os.replace(self.exception_temp_path, self.exception_path)
+        for path in self.output_paths:
+            os.replace(f"{path}.tmp", path)
+
+    def close(self):
+        for file in self.output_files:
+            file.close()
+        for path in [self.duplicates_path, self.exception_temp_path] + [f"{path}.tmp" for path in self.output_paths]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+FixedWidthField = namedtuple('FixedWidthField', ['name', 'width', 'justify', 'transform', 'fallback'], defaults=[None])
+
+RIC_HEADER = "RIC94600052980039217         COUNTY OF SACRAMENTO                         700 H SREET                             SACRAMENTO               CA95814    9168746329               "
+
+def _text(column):
+    return lambda data: data[column].astype(str)
+
+def _constant(value):
+    return lambda data: pd.Series(value, index=data.index, dtype=object)
+
+PIC_LAYOUT = (
+    FixedWidthField('record_identifier', 3, 'left', _constant('PIC')),
+    FixedWidthField('ssn', 9, 'left', lambda data: data['Tax ID'].astype(str).str.replace('-', '', regex=False)),
+    FixedWidthField('first_name', 16, 'left', _text('Organization First Name')),
+    FixedWidthField('middle_initial', 1, 'left', lambda data: data['Organization Middle Name'].astype(str).str[:1]),
+    FixedWidthField('last_name', 30, 'left', _text('Organization Last Name')),
+    FixedWidthField('address', 40, 'left', lambda data: (data['Organization Street Line1 Address'].astype(str) + ' '
+                                                         + data['Organization Street Line2 Address'].astype(str)).str.strip()),
+    FixedWidthField('city', 25, 'left', _text('Organization City')),
+    FixedWidthField('state', 2, 'left', _text('Organization State')),
+    FixedWidthField('zip_code', 5, 'left', lambda data: data['Organization Zip code'].astype(str).str.split('-').str[0]),
+    FixedWidthField('zip_extension', 4, 'left', lambda data: data['Organization Zip code'].astype(str).str.split('-').str[1].fillna('')),
+    FixedWidthField('start_date', 8, None, lambda data: DataProcessor.parse_dates(data['Start Date of Contract']),
+                    lambda data, position: DataProcessor.format_date(data['Start Date of Contract'].iat[position])),
+    FixedWidthField('amount', 11, 'right', lambda data: DataProcessor.parse_amounts(data['Amount of Contract']),
+                    lambda data, position: DataProcessor.format_amount(data['Amount of Contract'].iat[position])),
+    FixedWidthField('contract_expiration', 8, 'left', _constant('')),
+    FixedWidthField('ongoing_contract', 1, 'left', _constant('Y')),
+    FixedWidthField('blank', 12, 'left', _constant('')),
+)
+
+TIC_LAYOUT = (
+    FixedWidthField('record_identifier', 3, 'left', _constant('TIC')),
+    FixedWidthField('pic_count', 11, 'right', lambda data: data['pic_count'].astype(str).str.zfill(11)),
+    FixedWidthField('blank', 162, 'left', _constant('')),
+)
+
+PrefetchedFile = namedtuple('PrefetchedFile', ['checkpoint', 'source', 'data', 'db_results', 'family'])
+
+TransformedFile = namedtuple('TransformedFile', ['date', 'formatted_data', 'exceptions', 'source_row_count',
+                                                 'output_row_count', 'exception_row_count'])
 
 class DataProcessor:
 
+    @staticmethod
+    def read_run_date(source_file_path):
+        try:
+            if isinstance(source_file_path, SourceReader):
+                lines = source_file_path.preamble
+            else:
+                lines = SourceReader.scan_preamble(source_file_path)
+            file_name = lines[0].split(',')[0].strip().upper().replace(' ', '_')
+            date_str = lines[2].split(',')[0].strip().upper().replace('RUN DATE: ', '').strip().split(' ')[0].replace('-', '_').upper()
+            run_date = datetime.strptime(date_str.replace('_', '-'), '%b-%d-%y')
+            return file_name, date_str, run_date
+        except Exception as e:
+            logging.error(f"Method Failed: read_run_date, Error: {e}")
+            raise
+
     @staticmethod
     def extract_date_range(source_file_path):
         try:
-            with open(source_file_path, 'r') as file:
-                lines = file.readlines()
-                file_name = lines[0].split(',')[0].strip().upper().replace(' ', '_')
-                date_str = lines[2].split(',')[0].strip().upper().replace('RUN DATE: ', '').strip().split(' ')[0].replace('-', '_').upper()
-                run_date = datetime.strptime(date_str.replace('_', '-'), '%b-%d-%y')
-                output_name = f"{file_name}_{date_str}"
-                required_comparisons = []
-
-                if run_date.month == 1 and run_date.day == 1:
-                    logging.info("Processing January 1st file. No previous file comparison needed.")
-                    return False, output_name, required_comparisons, file_name
-                else:
-                    current_year = run_date.year
-                    for month in range(1, run_date.month + (1 if run_date.day > 1 else 0)):
-                        for day in (1, 15):
-                            if (month == run_date.month and day >= run_date.day):
-                                break
-                            comparison_date = datetime(current_year, month, day)
-                            required_comparisons.append(comparison_date.strftime('%b_%d_%y'))
-                    logging.info(f"File from {output_name} requires comparison with files from: {', '.join(required_comparisons)}")
-                    return True, output_name, required_comparisons, file_name
+            file_name, date_str, run_date = DataProcessor.read_run_date(source_file_path)
+            output_name = f"{file_name}_{date_str}"
+            required_comparisons = []
+
+            if run_date.month == 1 and run_date.day == 1:
+                logging.info("Processing January 1st file. No previous file comparison needed.")
+                return False, output_name, required_comparisons, file_name
+            else:
+                current_year = run_date.year
+                for month in range(1, run_date.month + (1 if run_date.day > 1 else 0)):
+                    for day in (1, 15):
+                        if (month == run_date.month and day >= run_date.day):
+                            break
+                        comparison_date = datetime(current_year, month, day)
+                        required_comparisons.append(comparison_date.strftime('%b_%d_%y'))
+                logging.info(f"File from {output_name} requires comparison with files from: {', '.join(required_comparisons)}")
+                return True, output_name, required_comparisons, file_name
         except Exception as e:
             logging.error(f"Method Failed: extract_date_range, Error: {e}")
             raise
@@ -75,15 +1148,16 @@ class DataProcessor:
     def read_data(source_file_path):
         try:
             logging.debug(f"Attempting to read data from {source_file_path}.")
-            data = pd.read_csv(source_file_path, skiprows=5, keep_default_na=False, na_filter=False)
+            if isinstance(source_file_path, SourceReader):
+                data = source_file_path.read()
+            else:
+                with SourceReader(source_file_path) as source:
+                    data = source.read()
 
             if data.empty:
                 raise ValueError(f"No data found in {source_file_path}")
 
-            for col in data.columns:
-                if 'Unnamed' in col:
-                    new_col_name = f"extra_col_{col.split('_')[-1]}"
-                    data.rename(columns={col: new_col_name}, inplace=True)
+            DataProcessor.rename_unnamed_columns(data)
             logging.info(f"Data read successfully from {source_file_path} with {data.shape[0]} rows.")
             return data
         except Exception as e:
@@ -91,78 +1165,102 @@ class DataProcessor:
             raise
 
     @staticmethod
-    def lookup_records(tax_ids):
+    def read_data_chunks(source_file_path, chunksize):
+        try:
+            logging.debug(f"Attempting to read data from {source_file_path} in chunks of {chunksize} rows.")
+            row_count = 0
+            source = source_file_path if isinstance(source_file_path, SourceReader) else SourceReader(source_file_path)
+            with source:
+                for chunk in source.read_chunks(chunksize):
+                    if chunk.empty:
+                        continue
+                    DataProcessor.rename_unnamed_columns(chunk)
+                    row_count += chunk.shape[0]
+                    yield chunk
+            if row_count == 0:
+                raise ValueError(f"No data found in {source_file_path}")
+            logging.info(f"Data streamed successfully from {source_file_path} with {row_count} rows.")
+        except Exception as e:
+            logging.error(f"Method Failed: read_data_chunks, Error: {e}")
+            raise
+
+    @staticmethod
+    def rename_unnamed_columns(data):
+        for col in data.columns:
+            if 'Unnamed' in col:
+                new_col_name = f"extra_col_{col.split('_')[-1]}"
+                data.rename(columns={col: new_col_name}, inplace=True)
+        return data
+
+    @staticmethod
+    def lookup_records(tax_ids, source_file=None):
         try:
-            tax_id_str = ', '.join(f"'{str(tax_id)}'" for tax_id in tax_ids)
-            query = f"""SELECT pers.ssn, pers.first_name, pers.last_name, pers.mid_name
-                        FROM edr.org org
-                        JOIN edr.pers pers ON org.tax_num_identif = pers.ssn
-                        WHERE org.tax_num_identif IN ({tax_id_str});"""
-            cursor = odbc_cursor.execute(query)
-            results = cursor.fetchall()
-            columns = [col[0] for col in cursor.description]
-            return [dict(zip(columns, result)) for result in results]
+            return record_lookup.lookup(tax_ids, source_file)
         except Exception as e:
             logging.error(f"Method Failed : lookup_records, Error: {e}")
             raise
 
     @staticmethod
-    def correct_misalignment(data):
+    def correct_misalignment(data, metrics=None):
         try:
             actual_columns = data.columns.tolist()
             start_shift_index = actual_columns.index('Organization Street Line2 Address')
-            for index, row in data.iterrows():
-                if pd.isna(row['Organization Street Line1 Address']) or not any(char.isalpha() for char in str(row['Organization Street Line1 Address'])):
-                    for i in range(start_shift_index, len(actual_columns)):
-                        if i > 0:
-                            prev_col = actual_columns[i - 1]
-                            current_col = actual_columns[i]
-                            data.at[index, prev_col] = row[current_col]
-                            data.at[index, current_col] = pd.NA
+            line1 = data['Organization Street Line1 Address']
+            misaligned = line1.isna().to_numpy() | ~DataProcessor._has_alpha(line1)
+            realigned_rows = int(misaligned.sum())
+
+            if realigned_rows:
+                shift_columns = actual_columns[max(start_shift_index, 1) - 1:]
+                data[shift_columns] = data[shift_columns].astype(object)
+                block = data[shift_columns].to_numpy(dtype=object)[misaligned]
+                block[:, :-1] = block[:, 1:]
+                block[:, -1] = pd.NA
+                data.iloc[np.flatnonzero(misaligned), [data.columns.get_loc(col) for col in shift_columns]] = block
+            logging.info(f"Corrected misalignment in {realigned_rows} rows.")
+            if metrics is not None:
+                metrics.count('realigned_rows', realigned_rows)
             return data
         except Exception as e:
             logging.error(f"Method Failed: correct_misalignment, Error: {e}")
             raise
 
     @staticmethod
-    def clean_and_handle_exceptions(data):
+    def _has_alpha(values):
+        text = values.astype(str)
+        has_alpha = text.str.contains('[A-Za-z]', regex=True).to_numpy(dtype=bool)
+        non_ascii = ~has_alpha & text.str.contains('[^\x00-\x7f]', regex=True).to_numpy(dtype=bool)
+        if non_ascii.any():
+            has_alpha[non_ascii] = [any(char.isalpha() for char in value) for value in text[non_ascii]]
+        return has_alpha
+
+    @staticmethod
+    def clean_and_handle_exceptions(data, metrics=None, db_results=None):
         try:
-            data = DataProcessor.correct_misalignment(data)
-            data['exception'] = False
-            data['comments'] = ''
+            metrics = metrics or PipelineMetrics(None)
+            data = DataProcessor.correct_misalignment(data, metrics)
 
-            keywords = set(["CENTER", "INC", "LLC", "CARE", "COMMONS", "OFFICE", "KIDS",
-                            "LEARNING", "RANCH", "APARTMENTS", "KIDZ", "PROPERTIES", "BRIDGE",
-                            "CLUB", "LP", "FRIENDS", "PRESCHOOL", "PARK", "KNOWLEDGE", "PORTSIDE",
-                            "PROPERTY", "ADVANCED", "WORLD", "MONTESS", "ACADEMY", "PETITE",
-                            "HONEST", "INVESTMENT", "SCHOOL", "PLAYHOUSE", "TYMES", "PLAYSCHOOL",
-                            "DAYCARE", "COUNTRY", "VILLA", "WAKING", "MONTESSORI"])
+            tax_ids = data['Tax ID'].astype(str)
 
-            tax_ids = data['Tax ID'].unique().tolist()
-            db_results = DataProcessor.lookup_records(tax_ids)
-            db_dict = {result['SSN']: result for result in db_results}
+            if db_results is None:
+                unique_tax_ids = data['Tax ID'].unique().tolist()
+                with metrics.stage('lookup_records', rows_in=len(unique_tax_ids)) as stage:
+                    db_results = DataProcessor.lookup_records(unique_tax_ids, metrics.source_file)
+                    stage.rows_out = len(db_results)
+            db_records = pd.DataFrame(db_results, columns=['SSN', 'FIRST_NAME', 'MID_NAME', 'LAST_NAME'])
+            db_records = db_records.drop_duplicates(subset='SSN', keep='last').set_index('SSN')
+            db_match = tax_ids.isin(db_records.index)
 
-            for index, row in data.iterrows():
-                keyword_exception = any(keyword in str(row['Organization First Name']).upper() for keyword in keywords)
-                address_exception = pd.isna(row['Organization Street Line1 Address']) or str(row['Organization Street Line1 Address']).strip() == ''
-                taxid_exception = '-' in str(row['Tax ID'])
+            # Rules see the source names, before they are replaced with the database values below.
+            exception, comments = get_exception_rules().evaluate(data, db_records.index, metrics)
 
-                db_record = db_dict.get(str(row['Tax ID']))
-                if db_record:
-                    data.at[index, 'Organization First Name'] = db_record['FIRST_NAME']
-                    data.at[index, 'Organization Middle Name'] = db_record['MID_NAME']
-                    data.at[index, 'Organization Last Name'] = db_record['LAST_NAME']
-                else:
-                    taxid_exception = True
+            matched_ids = tax_ids[db_match]
+            for column, db_column in (('Organization First Name', 'FIRST_NAME'),
+                                      ('Organization Middle Name', 'MID_NAME'),
+                                      ('Organization Last Name', 'LAST_NAME')):
+                data.loc[db_match, column] = matched_ids.map(db_records[db_column])
 
-                if any([keyword_exception, address_exception, taxid_exception]):
-                    data.at[index, 'exception'] = True
-                    if keyword_exception:
-                        data.at[index, 'comments'] += ' This is an Organisation TaxID.'
-                    if address_exception:
-                        data.at[index, 'comments'] += ' Missing Line1 Address.'
-                    if taxid_exception:
-                        data.at[index, 'comments'] += ' Invalid Tax ID or Tax ID not found in database.'
+            data['exception'] = exception
+            data['comments'] = comments
 
             exceptions = data[data['exception']].copy()
             clean_data = data[~data['exception']].copy()
@@ -171,31 +1269,102 @@ class DataProcessor:
             logging.error(f"Method Failed: clean_and_handle_exceptions, Error: {e}")
             raise
 
+    @staticmethod
+    def _comment_column(mask, comment):
+        return pd.Series(np.where(mask, comment, ''), index=mask.index, dtype=object)
+
     @staticmethod
     def remove_special_characters(data):
         try:
-            data.replace({'[,.#]': ''}, regex=True, inplace=True)
+            for column in SPECIAL_CHARACTER_COLUMNS:
+                if column in data.columns:
+                    data[column] = DataProcessor.compact_column(data[column])
             return data
         except Exception as e:
             logging.error(f"Method Failed: remove_special_characters, Error: {e}")
             raise
 
+    @staticmethod
+    def compact_column(values):
+        codes, uniques = pd.factorize(values)
+        if len(uniques) == 0:
+            return values
+        uniques = pd.Series(np.asarray(uniques, dtype=object))
+        cleaned = uniques.str.replace(SPECIAL_CHARACTERS, '', regex=True)
+        cleaned = cleaned.where(cleaned.notna(), uniques)
+        inverse, categories = pd.factorize(cleaned)
+        missing = codes < 0
+        codes = np.where(missing, -1, inverse[codes])
+        if len(categories) <= len(values) * CATEGORY_MAX_RATIO:
+            categories = pd.Index(categories, dtype=object)
+            return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=values.index)
+        compacted = np.asarray(categories, dtype=object)[codes]
+        compacted[missing] = values.to_numpy(dtype=object)[missing]
+        return pd.Series(compacted, index=values.index, dtype=object)
+
+    @staticmethod
+    def expand_categories(data):
+        # Taking from the categories reuses their string objects; astype(str) would build one string per row.
+        expanded = {}
+        for column in data.columns:
+            if isinstance(data[column].dtype, pd.CategoricalDtype):
+                values = data[column].cat
+                categories = np.append(values.categories.to_numpy(dtype=object), [np.nan])
+                expanded[column] = pd.Series(categories[values.codes.to_numpy()], index=data.index, dtype=object)
+        return data.assign(**expanded) if expanded else data
+
+    @staticmethod
+    def row_hashes(data):
+        hashes = np.zeros(len(data), dtype=np.uint64)
+        for column in data.columns:
+            column_hashes = pd.util.hash_pandas_object(data[column], index=False).to_numpy().copy()
+            column_hashes[data[column].isna().to_numpy()] = NULL_HASH
+            hashes = hashes * np.uint64(0x100000001B3) ^ column_hashes
+        return hashes
+
     @staticmethod
     def remove_duplicates(data):
         try:
-            data.drop_duplicates(inplace=True)
-            return data
+            duplicated = pd.Series(DataProcessor.row_hashes(data)).duplicated().to_numpy()
+            if not duplicated.any():
+                return data
+            return data[~duplicated].copy()
         except Exception as e:
             logging.error(f"Method Failed: remove_duplicates, Error: {e}")
             raise
 
+    @staticmethod
+    def remove_seen_duplicates(data, seen_hashes):
+        # seen_hashes is the sorted uint64 array of row hashes kept from earlier chunks; the updated array is returned.
+        try:
+            row_hashes = DataProcessor.row_hashes(data)
+            keep = ~pd.Series(row_hashes).duplicated().to_numpy()
+            if len(seen_hashes):
+                positions = np.minimum(np.searchsorted(seen_hashes, row_hashes), len(seen_hashes) - 1)
+                keep &= seen_hashes[positions] != row_hashes
+            new_hashes = np.sort(row_hashes[keep])
+            seen_hashes = np.insert(seen_hashes, np.searchsorted(seen_hashes, new_hashes), new_hashes)
+            return data[keep].copy(), seen_hashes
+        except Exception as e:
+            logging.error(f"Method Failed: remove_seen_duplicates, Error: {e}")
+            raise
+
     @staticmethod
     def archive_files(source_file_path, archive_dir):
         try:
             current_year_str = datetime.now().strftime('%Y')
             year_based_archive_dir = os.path.join(archive_dir, current_year_str)
             DataProcessor.ensure_directory_exists(year_based_archive_dir)
-            shutil.move(source_file_path, os.path.join(year_based_archive_dir, os.path.basename(source_file_path)))
+            archive_path = os.path.join(year_based_archive_dir, os.path.basename(source_file_path))
+            try:
+                os.replace(source_file_path, archive_path)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                temp_path = f"{archive_path}.tmp"
+                shutil.copy2(source_file_path, temp_path)
+                os.replace(temp_path, archive_path)
+                os.remove(source_file_path)
             logging.info(f"File {source_file_path} archived successfully.")
         except Exception as e:
             logging.error(f"Method Failed: archive_files, Error: {e}", exc_info=True)
@@ -203,6 +1372,31 @@ class DataProcessor:
 
     @staticmethod
     def write_output(data, output_dir, exceptions, exception_dir, date, source_file):
+        try:
+            output_file_path, output_file_path2, exception_file_path = DataProcessor.output_paths(output_dir, exception_dir, date, source_file)
+
+            try:
+                for path in (output_file_path, output_file_path2):
+                    with open(f"{path}.tmp", 'w') as file:
+                        file.write(data)
+                if isinstance(exceptions, pd.DataFrame):
+                    exceptions.to_csv(f"{exception_file_path}.tmp", index=False)
+                    os.replace(f"{exception_file_path}.tmp", exception_file_path)
+                for path in (output_file_path, output_file_path2):
+                    os.replace(f"{path}.tmp", path)
+            finally:
+                for path in (output_file_path, output_file_path2, exception_file_path):
+                    if os.path.exists(f"{path}.tmp"):
+                        os.remove(f"{path}.tmp")
+            DataProcessor.index_output(output_file_path, date)
+
+            logging.info(f"Output and exceptions written successfully to {output_file_path} and {exception_file_path}.")
+        except Exception as e:
+            logging.error(f"Method Failed: write_output, Error: {e}", exc_info=True)
+            raise
+
+    @staticmethod
+    def output_paths(output_dir, exception_dir, date, source_file):
         try:
             current_year_str = datetime.now().strftime('%Y')
             year_based_output_dir = os.path.join(output_dir, current_year_str)
@@ -212,18 +1406,9 @@ class DataProcessor:
             output_file_path = os.path.join(year_based_output_dir, f"output_{date}.txt")
             output_file_path2 = os.path.join(source_file, f"output_{date}.txt")
             exception_file_path = os.path.join(year_based_exception_dir, f"exceptions_{date}.csv")
-
-            with open(output_file_path, 'w') as file:
-                file.write(data)
-            with open(output_file_path2, 'w') as file:
-                file.write(data)
-
-            if isinstance(exceptions, pd.DataFrame):
-                exceptions.to_csv(exception_file_path, index=False)
-
-            logging.info(f"Output and exceptions written successfully to {output_file_path} and {exception_file_path}.")
+            return output_file_path, output_file_path2, exception_file_path
         except Exception as e:
-            logging.error(f"Method Failed: write_output, Error: {e}", exc_info=True)
+            logging.error(f"Method Failed: output_paths, Error: {e}")
             raise
 
     @staticmethod
@@ -236,94 +1421,419 @@ class DataProcessor:
             raise
 
     @staticmethod
-    def format_output(data):
+    def format_output(data, include_header=True):
         try:
             if not isinstance(data, pd.DataFrame):
                 raise TypeError("Expected a DataFrame but got a different datatype.")
-            data = data.fillna('')
-            formatted_data = ''
-            header = "RIC94600052980039217         COUNTY OF SACRAMENTO                         700 H SREET                             SACRAMENTO               CA95814    9168746329               "
-            footer = ""
-            formatted_data = header + '\n'
-            
-            for index, row in data.iterrows():
-                record_identifier = "PIC".ljust(3)
-                ssn = str(row['Tax ID']).replace('-', '').ljust(9)[:9]
-                first_name = str(row['Organization First Name']).ljust(16)[:16]
-                middle_initial = (str(row['Organization Middle Name'])[:1] if pd.notna(row['Organization Middle Name']) else '').ljust(1)
-                last_name = str(row['Organization Last Name']).ljust(30)[:30]
-                address_line1 = str(row['Organization Street Line1 Address'])
-                address_line2 = str(row['Organization Street Line2 Address']) if pd.notna(row['Organization Street Line2 Address']) else ''
-                address = (address_line1 + " " + address_line2).strip().ljust(40)[:40]
-                city = str(row['Organization City']).ljust(25)[:25]
-                state = str(row['Organization State']).ljust(2)[:2]
-                zip_code = str(row['Organization Zip code']).split('-')[0].ljust(5)[:5]
-                zip_extension = (row['Organization Zip code'].split('-')[1] if '-' in str(row['Organization Zip code']) else '').ljust(4)[:4]
-                try:
-                    start_date = pd.to_datetime(row['Start Date of Contract'], format='%m/%d/%Y').strftime('%Y%m%d')
-                except ValueError as e:
-                    logging.error(f"Method Failed: format_output, Error: Error parsing date {row['Start Date of Contract']}: {e}")
-                    start_date = 'InvalidDate'
-                try:
-                    amount = f"{int(str(row['Amount of Contract']).replace('$', '').replace(',', '')):011d}".rjust(11)
-                except ValueError:
-                    logging.error(f"Method Failed: format_output, Error: Failed to convert amount for record: {row['Amount of Contract']}")
-                    amount = 'InvalidAmount'
-                contract_exp = ' ' * 8
-                ongoing_contract = 'Y'
-                blank = ' ' * 12
-                formatted_row = (record_identifier + ssn + first_name + middle_initial + last_name +
-                                 address + city + state + zip_code + zip_extension +
-                                 start_date + amount + contract_exp + ongoing_contract + blank)
-                formatted_data += formatted_row + '\n'
-            return formatted_data
+            data = DataProcessor.expand_categories(data).fillna('')
+            records = DataProcessor.render_fixed_width(data, PIC_LAYOUT)
+            header = RIC_HEADER + '\n' if include_header else ''
+            return header + ''.join(record + '\n' for record in records)
         except Exception as e:
             logging.error(f"Method Failed: format_output, Error: {e}")
             raise
 
     @staticmethod
-    def process_data(directory, archive_dir, exception_dir, output_dir):
+    def format_footer(pic_count):
+        try:
+            return DataProcessor.render_fixed_width(pd.DataFrame({'pic_count': [pic_count]}), TIC_LAYOUT)[0]
+        except Exception as e:
+            logging.error(f"Method Failed: format_footer, Error: {e}")
+            raise
+
+    @staticmethod
+    def render_fixed_width(data, layout):
+        try:
+            if data.empty:
+                return []
+            columns = [field.transform(data) for field in layout]
+
+            fallback_rows = np.zeros(len(data), dtype=bool)
+            for values in columns:
+                fallback_rows |= values.isna().to_numpy()
+            for position in np.flatnonzero(fallback_rows):
+                for field, values in zip(layout, columns):
+                    if field.fallback is not None and pd.isna(values.iat[position]):
+                        values.iat[position] = field.fallback(data, position)
+
+            rendered = []
+            for field, values in zip(layout, columns):
+                if field.justify == 'left':
+                    values = values.str.ljust(field.width).str[:field.width]
+                elif field.justify == 'right':
+                    values = values.str.rjust(field.width)
+                rendered.append(values)
+            return rendered[0].str.cat(rendered[1:]).tolist()
+        except Exception as e:
+            logging.error(f"Method Failed: render_fixed_width, Error: {e}")
+            raise
+
+    @staticmethod
+    def parse_dates(values):
+        parsed = pd.to_datetime(values, format='%m/%d/%Y', errors='coerce')
+        return parsed.dt.strftime('%Y%m%d').astype(object).where(parsed.notna(), None)
+
+    @staticmethod
+    def format_date(value):
+        try:
+            return pd.to_datetime(value, format='%m/%d/%Y').strftime('%Y%m%d')
+        except ValueError as e:
+            logging.error(f"Method Failed: format_output, Error: Error parsing date {value}: {e}")
+            return 'InvalidDate'
+
+    @staticmethod
+    def parse_amounts(values):
+        digits = values.astype(str).str.replace('$', '', regex=False).str.replace(',', '', regex=False)
+        valid = digits.str.fullmatch('[0-9]+').fillna(False).astype(bool)
+        return digits.str.lstrip('0').str.zfill(11).astype(object).where(valid, None)
+
+    @staticmethod
+    def format_amount(value):
+        try:
+            return f"{int(str(value).replace('$', '').replace(',', '')):011d}".rjust(11)
+        except ValueError:
+            logging.error(f"Method Failed: format_output, Error: Failed to convert amount for record: {value}")
+            return 'InvalidAmount'
+
+    @staticmethod
+    def process_data(directory, archive_dir, exception_dir, output_dir, chunksize=None, workers=1, lookup_options=None,
+                     manifest_options=None, pipeline=False, rules_path=None):
         try:
             logging.info("Starting data processing.")
             files = sorted(glob(os.path.join(directory, '*.csv')))
+            if workers > 1:
+                if pipeline:
+                    logging.warning("Pipelined processing is not available with --workers > 1, files are processed by the worker pool.")
+                failures = DataProcessor.process_files_parallel(files, directory, archive_dir, exception_dir, output_dir,
+                                                                chunksize, workers, lookup_options or {}, manifest_options or {},
+                                                                rules_path)
+                if failures:
+                    for file, error in failures.items():
+                        logging.critical(f"Processing failed for {file}: {error}")
+                    raise RuntimeError(f"{len(failures)} of {len(files)} files failed")
+                return
+            if pipeline and not chunksize:
+                DataProcessor.process_files_pipelined(files, directory, archive_dir, exception_dir, output_dir)
+                return
+            if pipeline:
+                logging.warning("Pipelined processing is not available for chunked runs, processing files one at a time.")
             for file in tqdm(files, desc="Processing files"):
-                logging.info(f"Starting data processing for {file}")
-                data = DataProcessor.read_data(file)
-                if data is not None:
-                    previous_data = pd.DataFrame()
-                    comparison_req, date, comparison, file_name = DataProcessor.extract_date_range(file)
-                    if comparison_req:
-                        logging.info(f"Comparing data with files from {comparison}")
-                        previous_paths = [os.path.join(output_dir, datetime.now().strftime('%Y'), f'output_{file_name}_{item.upper()}.txt') for item in comparison]
-                        previous_data = DataProcessor.read_previous_outputs(previous_paths)
-                        
-                    data, exceptions = DataProcessor.clean_and_handle_exceptions(data)
-                    data = DataProcessor.remove_special_characters(data)
-                    data = DataProcessor.remove_duplicates(data)
-                    data, found_duplicates = DataProcessor.check_for_duplicates(data, previous_data)
-                    exceptions = pd.concat([exceptions, found_duplicates], ignore_index=True)
-                    exceptions = exceptions.drop(columns=['exception', 'extra_col_Unnamed: 11'])
-                    formatted_data = DataProcessor.format_output(data)
-
-                    source_row_count = data.shape[0] + exceptions.shape[0]
-                    output_row_count = formatted_data.count('\n') - 1
-                    exception_row_count = exceptions.shape[0]
-                    footer_rec_identifier = "TIC"
-                    footer_pic_count = str(output_row_count).zfill(11)
-                    footer_blank = ' ' * 162
-                    footer = footer_rec_identifier + footer_pic_count + footer_blank
-                    formatted_data += footer
-                    DataProcessor.write_output(formatted_data, output_dir, exceptions, exception_dir, date, directory)
-                    DataProcessor.archive_files(file, archive_dir)
-                    logging.info(f"Validation for {file}: Source Rows = {source_row_count}, Output Rows = {output_row_count}, Exception Rows = {exception_row_count}")
-                    assert source_row_count == output_row_count + exception_row_count, "Row count mismatch: Source does not equal Output + Exceptions"
-                else:
-                    raise ValueError(f"Data is Empty for {file}")
-                logging.info(f"Data processing completed for {file}")
+                DataProcessor.process_source_file(file, directory, archive_dir, exception_dir, output_dir, chunksize)
         except Exception as e:
             logging.critical(f"Critical error during processing: {e}")
             exit(1)
 
+    @staticmethod
+    def process_source_file(file, directory, archive_dir, exception_dir, output_dir, chunksize=None):
+        logging.info(f"Starting data processing for {file}")
+        metrics = PipelineMetrics(file)
+        checkpoint = FileCheckpoint(run_manifest, file, verify=resume_run)
+        try:
+            if resume_run and checkpoint.completed('written') and checkpoint.outputs_exist():
+                logging.info(f"Resuming {file} after its last completed stage '{checkpoint.entry['stage']}'.")
+                DataProcessor.archive_checkpointed_file(file, archive_dir, metrics, checkpoint)
+            elif chunksize:
+                checkpoint.mark('started')
+                DataProcessor.process_file_chunked(file, directory, archive_dir, exception_dir, output_dir, chunksize, metrics, checkpoint)
+            else:
+                checkpoint.mark('started')
+                DataProcessor.process_file(file, directory, archive_dir, exception_dir, output_dir, metrics, checkpoint)
+        except Exception as e:
+            checkpoint.fail(str(e))
+            metrics.write(metrics_path, 'failed', str(e))
+            raise
+        metrics.write(metrics_path, 'completed')
+        logging.info(f"Data processing completed for {file}")
+
+    @staticmethod
+    def process_files_pipelined(files, directory, archive_dir, exception_dir, output_dir):
+        logging.info(f"Processing {len(files)} files with lookups and writes overlapped.")
+        if tracemalloc.is_tracing():
+            logging.info("Per-stage tracemalloc peaks are not recorded with --pipeline; only run-level peaks are available.")
+        prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch')
+        writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='write')
+        pending_writes = {}
+        try:
+            upcoming = None
+            for index, file in enumerate(tqdm(files, desc="Processing files")):
+                if upcoming is None:
+                    upcoming = DataProcessor.submit_prefetch(prefetcher, file)
+                metrics, future = upcoming
+                upcoming = DataProcessor.submit_prefetch(prefetcher, files[index + 1]) if index + 1 < len(files) else None
+                DataProcessor.raise_failed_writes(pending_writes.values())
+                logging.info(f"Starting data processing for {file}")
+                try:
+                    prefetched = future.result()
+                except Exception as e:
+                    metrics.write(metrics_path, 'failed', str(e))
+                    raise
+                checkpoint = prefetched.checkpoint
+                if prefetched.data is None:
+                    logging.info(f"Resuming {file} after its last completed stage '{checkpoint.entry['stage']}'.")
+                    pending_writes[file] = writer.submit(DataProcessor.write_prefetched_file, file, metrics, checkpoint,
+                                                         DataProcessor.archive_checkpointed_file, file, archive_dir, metrics, checkpoint)
+                    continue
+                # Earlier periods of the same family must be on disk before their PICs are compared.
+                if prefetched.family in pending_writes:
+                    pending_writes.pop(prefetched.family).result()
+                try:
+                    checkpoint.mark('started')
+                    transformed = DataProcessor.transform_file(prefetched.source, prefetched.data, output_dir, metrics,
+                                                               prefetched.db_results)
+                except Exception as e:
+                    checkpoint.fail(str(e))
+                    metrics.write(metrics_path, 'failed', str(e))
+                    raise
+                pending_writes[prefetched.family] = writer.submit(DataProcessor.write_prefetched_file, file, metrics, checkpoint,
+                                                                  DataProcessor.write_file, file, directory, archive_dir,
+                                                                  exception_dir, output_dir, metrics, checkpoint, transformed)
+            for future in list(pending_writes.values()):
+                future.result()
+        finally:
+            prefetcher.shutdown(wait=True, cancel_futures=True)
+            writer.shutdown(wait=True)
+
+    @staticmethod
+    def submit_prefetch(prefetcher, file):
+        # tracemalloc peaks are process-wide, so with the prefetch thread running they cannot be split by stage.
+        metrics = PipelineMetrics(file, trace_stages=False)
+        return metrics, prefetcher.submit(DataProcessor.prefetch_file, file, metrics)
+
+    @staticmethod
+    def prefetch_file(file, metrics):
+        checkpoint = FileCheckpoint(run_manifest, file, verify=resume_run)
+        if resume_run and checkpoint.completed('written') and checkpoint.outputs_exist():
+            return PrefetchedFile(checkpoint, None, None, None, None)
+        try:
+            source, data = DataProcessor.read_source(file, metrics, checkpoint)
+            family = DataProcessor.read_run_date(source)[0]
+            unique_tax_ids = data['Tax ID'].unique().tolist()
+            with metrics.stage('lookup_records', rows_in=len(unique_tax_ids)) as stage:
+                db_results = DataProcessor.lookup_records(unique_tax_ids, file)
+                stage.rows_out = len(db_results)
+        except Exception as e:
+            checkpoint.fail(str(e))
+            raise
+        return PrefetchedFile(checkpoint, source, data, db_results, family)
+
+    @staticmethod
+    def write_prefetched_file(file, metrics, checkpoint, write, *args):
+        try:
+            write(*args)
+        except Exception as e:
+            logging.error(f"Processing failed for {file}: {e}")
+            checkpoint.fail(str(e))
+            metrics.write(metrics_path, 'failed', str(e))
+            raise
+        metrics.write(metrics_path, 'completed')
+        logging.info(f"Data processing completed for {file}")
+
+    @staticmethod
+    def raise_failed_writes(futures):
+        for future in futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+
+    @staticmethod
+    def group_file_families(files):
+        families = {}
+        for file in files:
+            try:
+                file_name, _, run_date = DataProcessor.read_run_date(file)
+            except Exception:
+                file_name, run_date = file, datetime.min
+            families.setdefault(file_name, []).append((run_date, file))
+        return [[file for _, file in sorted(family)] for family in families.values()]
+
+    @staticmethod
+    def process_files_parallel(files, directory, archive_dir, exception_dir, output_dir, chunksize, workers, lookup_options,
+                               manifest_options, rules_path=None):
+        families = [list(reversed(family)) for family in DataProcessor.group_file_families(files)]
+        logging.info(f"Processing {len(files)} files from {len(families)} file families with {workers} workers.")
+        failures = {}
+        root_logger = logging.getLogger()
+        log_queue = multiprocessing.Queue()
+        listener = QueueListener(log_queue, *root_logger.handlers, respect_handler_level=True)
+        listener.start()
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(log_queue, root_logger.level, lookup_options, manifest_options, rules_path, metrics_path)) as executor, \
+                    tqdm(total=len(files), desc="Processing files") as progress:
+                pending = {}
+
+                def submit_next(family):
+                    if family:
+                        file = family.pop()
+                        future = executor.submit(_process_file_task, file, directory, archive_dir, exception_dir, output_dir, chunksize)
+                        pending[future] = (file, family)
+
+                for family in families:
+                    submit_next(family)
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        file, family = pending.pop(future)
+                        progress.update(1)
+                        try:
+                            error = future.result()
+                        except Exception as e:
+                            error = str(e) or type(e).__name__
+                        if error is None:
+                            submit_next(family)
+                            continue
+                        failures[file] = error
+                        while family:
+                            skipped = family.pop()
+                            failures[skipped] = f"Skipped because {os.path.basename(file)} from the same file family failed"
+                            progress.update(1)
+        finally:
+            listener.stop()
+        return failures
+
+    @staticmethod
+    def process_file(file, directory, archive_dir, exception_dir, output_dir, metrics, checkpoint):
+        source, data = DataProcessor.read_source(file, metrics, checkpoint)
+        transformed = DataProcessor.transform_file(source, data, output_dir, metrics)
+        DataProcessor.write_file(file, directory, archive_dir, exception_dir, output_dir, metrics, checkpoint, transformed)
+
+    @staticmethod
+    def read_source(file, metrics, checkpoint):
+        with metrics.stage('read_data') as stage, SourceReader(file) as source:
+            data = DataProcessor.read_data(source)
+            if data is None:
+                raise ValueError(f"Data is Empty for {file}")
+            stage.rows_out = len(data)
+        checkpoint.set_content_hash(source.content_hash)
+        return source, data
+
+    @staticmethod
+    def transform_file(source, data, output_dir, metrics, db_results=None):
+        with metrics.stage('load_previous_data'):
+            date, previous_pics = DataProcessor.load_previous_data(source, output_dir)
+
+        try:
+            with metrics.stage('clean_and_handle_exceptions', rows_in=len(data)) as stage:
+                data, exceptions = DataProcessor.clean_and_handle_exceptions(data, metrics, db_results)
+                stage.rows_out = len(data) + len(exceptions)
+            with metrics.stage('remove_special_characters', rows_in=len(data)) as stage:
+                data = DataProcessor.remove_special_characters(data)
+                stage.rows_out = len(data)
+            with metrics.stage('remove_duplicates', rows_in=len(data)) as stage:
+                data = DataProcessor.remove_duplicates(data)
+                stage.rows_out = len(data)
+            with metrics.stage('check_for_duplicates', rows_in=len(data)) as stage:
+                data, found_duplicates = DataProcessor.check_for_duplicates(data, previous_pics)
+                stage.rows_out = len(data)
+        finally:
+            if previous_pics is not None:
+                previous_pics.close()
+        exceptions = pd.concat([exceptions, found_duplicates], ignore_index=True)
+        exceptions = exceptions.drop(columns=['exception', 'extra_col_Unnamed: 11'])
+        with metrics.stage('format_output', rows_in=len(data)) as stage:
+            formatted_data = DataProcessor.format_output(data)
+            stage.rows_out = formatted_data.count('\n') - 1
+
+        source_row_count = data.shape[0] + exceptions.shape[0]
+        output_row_count = formatted_data.count('\n') - 1
+        exception_row_count = exceptions.shape[0]
+        formatted_data += DataProcessor.format_footer(output_row_count)
+        return TransformedFile(date, formatted_data, exceptions, source_row_count, output_row_count, exception_row_count)
+
+    @staticmethod
+    def write_file(file, directory, archive_dir, exception_dir, output_dir, metrics, checkpoint, transformed):
+        with metrics.stage('write_output', rows_in=transformed.output_row_count + transformed.exception_row_count):
+            DataProcessor.write_output(transformed.formatted_data, output_dir, transformed.exceptions, exception_dir,
+                                       transformed.date, directory)
+        DataProcessor.finish_file(file, archive_dir, output_dir, exception_dir, transformed.date, directory, metrics, checkpoint,
+                                  transformed.source_row_count, transformed.output_row_count, transformed.exception_row_count)
+
+    @staticmethod
+    def process_file_chunked(file, directory, archive_dir, exception_dir, output_dir, chunksize, metrics, checkpoint):
+        with SourceReader(file) as source:
+            with metrics.stage('load_previous_data'):
+                date, previous_pics = DataProcessor.load_previous_data(source, output_dir)
+            output_file_path, output_file_path2, exception_file_path = DataProcessor.output_paths(output_dir, exception_dir, date, directory)
+            writer = ChunkedOutputWriter([output_file_path, output_file_path2], exception_file_path)
+            seen_hashes = np.empty(0, dtype=np.uint64)
+            source_row_count = output_row_count = exception_row_count = 0
+            try:
+                writer.write_records(RIC_HEADER + '\n')
+                for chunk in metrics.timed_iter('read_data', DataProcessor.read_data_chunks(source, chunksize)):
+                    with metrics.stage('clean_and_handle_exceptions', rows_in=len(chunk)) as stage:
+                        data, exceptions = DataProcessor.clean_and_handle_exceptions(chunk, metrics)
+                        stage.rows_out = len(data) + len(exceptions)
+                    with metrics.stage('remove_special_characters', rows_in=len(data)) as stage:
+                        data = DataProcessor.remove_special_characters(data)
+                        stage.rows_out = len(data)
+                    with metrics.stage('remove_duplicates', rows_in=len(data)) as stage:
+                        data, seen_hashes = DataProcessor.remove_seen_duplicates(data, seen_hashes)
+                        stage.rows_out = len(data)
+                    with metrics.stage('check_for_duplicates', rows_in=len(data)) as stage:
+                        data, found_duplicates = DataProcessor.check_for_duplicates(data, previous_pics)
+                        stage.rows_out = len(data)
+                    exceptions = exceptions.drop(columns=['exception', 'extra_col_Unnamed: 11'])
+                    if not found_duplicates.empty:
+                        found_duplicates = found_duplicates.drop(columns=['exception', 'extra_col_Unnamed: 11'])
+                    with metrics.stage('format_output', rows_in=len(data)) as stage:
+                        records = DataProcessor.format_output(data, include_header=False)
+                        stage.rows_out = records.count('\n')
+                    chunk_output_count = records.count('\n')
+                    chunk_exception_count = exceptions.shape[0] + found_duplicates.shape[0]
+                    with metrics.stage('write_output', rows_in=chunk_output_count + chunk_exception_count):
+                        writer.write_records(records)
+                        writer.write_exceptions(exceptions, found_duplicates)
+
+                    source_row_count += data.shape[0] + chunk_exception_count
+                    output_row_count += chunk_output_count
+                    exception_row_count += chunk_exception_count
+                with metrics.stage('write_output'):
+                    writer.write_records(DataProcessor.format_footer(output_row_count))
+                    writer.finish()
+            finally:
+                writer.close()
+                if previous_pics is not None:
+                    previous_pics.close()
+        checkpoint.set_content_hash(source.content_hash)
+        with metrics.stage('write_output'):
+            DataProcessor.index_output(output_file_path, date)
+        logging.info(f"Output and exceptions written successfully to {output_file_path} and {exception_file_path}.")
+        DataProcessor.finish_file(file, archive_dir, output_dir, exception_dir, date, directory, metrics, checkpoint,
+                                  source_row_count, output_row_count, exception_row_count)
+
+    @staticmethod
+    def finish_file(file, archive_dir, output_dir, exception_dir, date, directory, metrics, checkpoint,
+                    source_row_count, output_row_count, exception_row_count):
+        counts = {'source_row_count': source_row_count, 'output_row_count': output_row_count,
+                  'exception_row_count': exception_row_count,
+                  'realigned_row_count': metrics.counters.get('realigned_rows', 0)}
+        checkpoint.mark('written', output_paths=list(DataProcessor.output_paths(output_dir, exception_dir, date, directory)), counts=counts)
+        DataProcessor.archive_checkpointed_file(file, archive_dir, metrics, checkpoint)
+
+    @staticmethod
+    def archive_checkpointed_file(file, archive_dir, metrics, checkpoint):
+        with metrics.stage('archive_files'):
+            DataProcessor.archive_files(file, archive_dir)
+        checkpoint.mark('archived')
+        record_lookup.purge_checkpoint(file)
+        counts = checkpoint.entry['counts'] if checkpoint.entry else {}
+        for name in ('source_row_count', 'output_row_count', 'exception_row_count'):
+            metrics.count(name.replace('_count', 's'), counts.get(name, 0))
+        DataProcessor.validate_counts(file, **counts)
+
+    @staticmethod
+    def load_previous_data(file, output_dir):
+        previous_pics = None
+        comparison_req, date, comparison, file_name = DataProcessor.extract_date_range(file)
+        if comparison_req:
+            logging.info(f"Comparing data with files from {comparison}")
+            previous_pics = DataProcessor.load_previous_pics(output_dir, file_name, [item.upper() for item in comparison])
+        return date, previous_pics
+
+    @staticmethod
+    def validate_counts(file, source_row_count, output_row_count, exception_row_count, realigned_row_count=0):
+        logging.info(f"Validation for {file}: Source Rows = {source_row_count}, Output Rows = {output_row_count}, Exception Rows = {exception_row_count}, Realigned Rows = {realigned_row_count}")
+        assert source_row_count == output_row_count + exception_row_count, "Row count mismatch: Source does not equal Output + Exceptions"
+
     @staticmethod
     def count_rows(file_path):
         try:
@@ -334,34 +1844,61 @@ class DataProcessor:
             raise
 
     @staticmethod
-    def read_previous_outputs(previous_files):
-        previous_data = pd.DataFrame()
+    def load_previous_pics(output_dir, file_name, periods):
         try:
-            colspecs = [
-                (0, 12)
-            ]
-            colnames = ['PIC']
-            for file_path in previous_files:
-                if os.path.exists(file_path):
-                    temp_data = pd.read_fwf(file_path, colspecs=colspecs, header=None, names=colnames, skiprows=1, skipfooter=1, engine='python')
-                    previous_data = pd.concat([previous_data, temp_data], ignore_index=True)
-                else:
-                    logging.warning(f"File not found: {file_path}")
-            return previous_data
+            pic_index = PicIndex.for_output_dir(output_dir)
+            try:
+                available_periods = []
+                for period in periods:
+                    file_path = os.path.join(pic_index.year_dir, f'output_{file_name}_{period}.txt')
+                    if os.path.exists(file_path):
+                        pic_index.ensure_indexed(file_name, period, file_path)
+                        available_periods.append(period)
+                    else:
+                        logging.warning(f"File not found: {file_path}")
+                return pic_index.view(file_name, available_periods)
+            except Exception:
+                pic_index.close()
+                raise
         except Exception as e:
-            logging.error(f"Method Failed : read_previous_outputs, Error: {e}")
-            return previous_data
+            logging.error(f"Method Failed : load_previous_pics, Error: {e}")
+            raise
 
     @staticmethod
-    def check_for_duplicates(current_data, previous_data):
+    def index_output(output_file_path, date):
         try:
-            if previous_data.empty or 'PIC' not in previous_data.columns:
+            family, period = PicIndex.split_output_name(date)
+            pic_index = PicIndex(os.path.dirname(output_file_path))
+            try:
+                pic_index.index_output(family, period, output_file_path)
+            finally:
+                pic_index.close()
+        except Exception as e:
+            logging.error(f"Method Failed : index_output, Error: {e}")
+            raise
+
+    @staticmethod
+    def rebuild_pic_index(output_dir):
+        try:
+            for year_dir in sorted(glob(os.path.join(output_dir, '[0-9][0-9][0-9][0-9]'))):
+                pic_index = PicIndex(year_dir)
+                try:
+                    pic_index.rebuild()
+                finally:
+                    pic_index.close()
+        except Exception as e:
+            logging.error(f"Method Failed : rebuild_pic_index, Error: {e}")
+            raise
+
+    @staticmethod
+    def check_for_duplicates(current_data, previous_pics):
+        try:
+            if previous_pics is None or previous_pics.empty:
                 logging.info("No previous data to compare against for duplicates.")
                 current_data['comments'] = None
                 return current_data, pd.DataFrame()
             current_data['ModifiedTaxID'] = 'PIC' + current_data['Tax ID'].astype(str)
-            previous_pics = previous_data['PIC'].tolist()
-            current_data['is_duplicate'] = current_data['ModifiedTaxID'].isin(previous_pics)
+            current_data['is_duplicate'] = previous_pics.contains_mask(current_data['ModifiedTaxID'])
             duplicates = current_data[current_data['is_duplicate']].copy()
             non_duplicates = current_data[~current_data['is_duplicate']]
             duplicates['comments'] = 'Exists in Previous file'
@@ -380,19 +1917,82 @@ def parse_args():
     parser.add_argument('--exception_dir', type=str, default='exceptions', help='Directory to store exceptions')
     parser.add_argument('--output_dir', type=str, default='output', help='Directory to store output files')
     parser.add_argument('--logs_dir', type=str, default='logs', help='Directory to store log files')
+    parser.add_argument('--profile', action='store_true', help='Dump cProfile stats for the run next to the log file')
+    parser.add_argument('--trace_memory', action='store_true',
+                        help='Record per-stage tracemalloc peaks in the metrics file (skipped with --pipeline, whose threads share them)')
+    parser.add_argument('--rebuild_pic_index', action='store_true', help='Rebuild the PIC duplicate index from existing output files and exit')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes used to process independent files')
+    parser.add_argument('--chunksize', type=int, default=None, help='Stream each source file in chunks of this many rows')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Overlap the next file\'s read and lookup, and this file\'s writes, with formatting')
+    parser.add_argument('--environment', type=str, default=None, choices=sorted(GlobalConfig.spark_dsns),
+                        help='Spark environment used for Tax ID lookups (defaults to $DATAPROCESSOR_ENVIRONMENT or dev)')
+    parser.add_argument('--reference_table', type=str, default=None,
+                        help='CSV or SQLite reference table used instead of Spark for dry runs and benchmarks')
+    parser.add_argument('--lookup_batch_size', type=int, default=1000, help='Number of Tax IDs per lookup query')
+    parser.add_argument('--lookup_workers', type=int, default=1, help='Number of database connections used for concurrent lookups')
+    parser.add_argument('--lookup_cache', type=str, default=None, help='SQLite file caching Tax ID lookup results between runs')
+    parser.add_argument('--lookup_cache_ttl_days', type=int, default=30, help='Days before a cached Tax ID lookup is refreshed')
+    parser.add_argument('--rules', type=str, default=None,
+                        help='JSON (or YAML, with PyYAML installed) file of exception rules added to or replacing the defaults')
+    parser.add_argument('--manifest', type=str, default=None,
+                        help='SQLite run manifest recording file hashes and stage checkpoints (defaults to <output_dir>/run_manifest.sqlite)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Pick up files from a failed run at their last completed stage, and checkpoint lookups next to the '
+                             'manifest until each file is archived so a further rerun can reuse them')
+    parser.add_argument('--lookup_checkpoint_ttl_hours', type=int, default=24,
+                        help='With --resume, hours a checkpointed lookup of an unarchived file stays reusable')
     return parser.parse_args()
 
 if __name__ == "__main__":
     try:
         args = parse_args()
-        setup(args.logs_dir)
+        log_filename = setup(args.logs_dir)
+        if args.rebuild_pic_index:
+            DataProcessor.rebuild_pic_index(args.output_dir)
+            exit(0)
+        manifest_options = {
+            "manifest_path": args.manifest or os.path.join(args.output_dir, 'run_manifest.sqlite'),
+            "resume": args.resume
+        }
+        configure_manifest(**manifest_options)
+        configure_rules(args.rules)
+        lookup_checkpoint = os.path.join(os.path.dirname(manifest_options["manifest_path"]), 'lookup_checkpoint.sqlite')
+        lookup_options = {
+            "lookup_workers": args.lookup_workers,
+            "batch_size": args.lookup_batch_size,
+            "cache_path": args.lookup_cache,
+            "cache_ttl_days": args.lookup_cache_ttl_days,
+            "environment": args.environment,
+            "reference_table": args.reference_table,
+            "checkpoint_path": lookup_checkpoint if args.resume else None,
+            "checkpoint_ttl_hours": args.lookup_checkpoint_ttl_hours
+        }
+        configure_lookup(**lookup_options)
         processor_args = {
             "directory": args.directory,
             "archive_dir": args.archive_dir,
             "exception_dir": args.exception_dir,
-            "output_dir": args.output_dir
+            "output_dir": args.output_dir,
+            "chunksize": args.chunksize,
+            "workers": args.workers,
+            "pipeline": args.pipeline,
+            "lookup_options": lookup_options,
+            "manifest_options": manifest_options,
+            "rules_path": args.rules
         }
-        DataProcessor.process_data(**processor_args)
+        if args.trace_memory:
+            tracemalloc.start()
+        if args.profile:
+            profiler = cProfile.Profile()
+            try:
+                profiler.runcall(DataProcessor.process_data, **processor_args)
+            finally:
+                profile_path = log_filename.replace('.log', '.prof')
+                profiler.dump_stats(profile_path)
+                logging.info(f"Profile stats written to {profile_path}.")
+        else:
+            DataProcessor.process_data(**processor_args)
     except Exception as e:
         logging.critical(f"An error occurred during data processing: {str(e)}")
         exit(1)
@@ -0,0 +1,31 @@
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import Common  # noqa: F401
+except ImportError:
+    # main.py only needs Common to open Spark connections; the tests inject their own cursors.
+    common = types.ModuleType('Common')
+    common.ConnectionHelper = types.ModuleType('Common.ConnectionHelper')
+    common.GlobalConfig = types.ModuleType('Common.GlobalConfig')
+    common.GlobalConfig.spark_dsns = {'dev': None}
+    common.GlobalConfig.spark_users = {'dev': None}
+    sys.modules.update({'Common': common, 'Common.ConnectionHelper': common.ConnectionHelper,
+                        'Common.GlobalConfig': common.GlobalConfig})
+
+import main
+
+
+@pytest.fixture
+def reference_records(monkeypatch):
+    """Serve Tax ID lookups from a dict of SSN -> (first, last, middle) instead of Spark."""
+    def install(records):
+        rows = {ssn: [(ssn, first, last, middle)] for ssn, (first, last, middle) in records.items()}
+        monkeypatch.setattr(main, 'connection_provider', main.ConnectionProvider(lambda: main.ReferenceTableCursor(rows)))
+        monkeypatch.setattr(main, 'record_lookup', main.RecordLookup())
+    return install
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+from main import DataProcessor
+
+
+def frame(rows):
+    return pd.DataFrame(rows, columns=['Tax ID', 'Organization First Name', 'Organization Middle Name'])
+
+
+def test_remove_seen_duplicates_across_chunks():
+    first = frame([['111111111', 'JOHN', 'A'], ['222222222', 'MARY', None], ['111111111', 'JOHN', 'A']])
+    second = frame([['222222222', 'MARY', None], ['222222222', 'MARY', ''], ['333333333', 'JOSE', 'B'],
+                    ['333333333', 'JOSE', 'B']])
+    seen_hashes = np.empty(0, dtype=np.uint64)
+
+    first, seen_hashes = DataProcessor.remove_seen_duplicates(first, seen_hashes)
+    second, seen_hashes = DataProcessor.remove_seen_duplicates(second, seen_hashes)
+
+    assert first.index.tolist() == [0, 1]
+    # A missing middle name and an empty one are different rows, as in remove_duplicates.
+    assert second.index.tolist() == [1, 2]
+    assert seen_hashes.dtype == np.uint64 and len(seen_hashes) == 4
+    assert (seen_hashes[:-1] <= seen_hashes[1:]).all()
+
+
+def test_remove_seen_duplicates_matches_remove_duplicates():
+    rows = [[str(100000000 + index % 7), 'NAME', str(index % 3)] for index in range(40)]
+    data = frame(rows)
+    seen_hashes = np.empty(0, dtype=np.uint64)
+    kept = []
+    for start in range(0, len(data), 9):
+        chunk, seen_hashes = DataProcessor.remove_seen_duplicates(data.iloc[start:start + 9], seen_hashes)
+        kept.append(chunk)
+
+    pd.testing.assert_frame_equal(pd.concat(kept), DataProcessor.remove_duplicates(data))
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+from main import DataProcessor
+
+COLUMNS = ['Tax ID', 'Organization First Name', 'Organization Middle Name', 'Organization Last Name',
+           'Organization Street Line1 Address', 'Organization Street Line2 Address', 'Organization City',
+           'Organization State', 'Organization Zip code', 'Start Date of Contract', 'Amount of Contract',
+           'extra_col_Unnamed: 11']
+
+KEYWORD = ' This is an Organisation TaxID.'
+ADDRESS = ' Missing Line1 Address.'
+TAX_ID = ' Invalid Tax ID or Tax ID not found in database.'
+
+
+def row(tax_id, first='JOHN', line1='1 MAIN ST', line2=''):
+    return [tax_id, first, 'Q', 'SOURCE', line1, line2, 'SACRAMENTO', 'CA', '95814', '01/02/2026', '$100', '']
+
+
+def test_exception_flags_and_comments(reference_records):
+    reference_records({'111111111': ('ANN', 'DB LAST', 'M'),
+                       '222222222': ('BOB', 'DB LAST', None),
+                       '333333333': ('CAROL', 'DB LAST', 'K'),
+                       '444444444': ('DAN', 'DB LAST', 'J'),
+                       '666666666': ('EVE', 'DB LAST', 'P')})
+    data = pd.DataFrame([
+        row('111111111'),                                    # clean
+        row('222222222', first='SUNNY KIDS'),                # keyword
+        row('333333333', line1=''),                          # blank Line1
+        row('444444444', line1=np.nan),                      # NaN Line1
+        row('555-55-5555'),                                  # '-' Tax ID
+        row('999999999'),                                    # not in the database
+        row('666666666', first='happy daycare', line1=''),   # keyword + address, keyword match is case-insensitive
+        row('777-77-7777', first='OAK PARK', line1=''),      # all three rules
+    ], columns=COLUMNS)
+
+    clean, exceptions = DataProcessor.clean_and_handle_exceptions(data)
+
+    assert clean['Tax ID'].tolist() == ['111111111']
+    assert exceptions['Tax ID'].tolist() == ['222222222', '333333333', '444444444', '555-55-5555', '999999999',
+                                             '666666666', '777-77-7777']
+    assert clean['exception'].tolist() == [False]
+    assert exceptions['exception'].tolist() == [True] * 7
+    assert clean['comments'].tolist() == ['']
+    assert exceptions['comments'].tolist() == [
+        KEYWORD,
+        ADDRESS,
+        ADDRESS,
+        TAX_ID,
+        TAX_ID,
+        KEYWORD + ADDRESS,
+        KEYWORD + ADDRESS + TAX_ID,
+    ]
+
+
+def test_database_names_replace_only_matched_ids(reference_records):
+    reference_records({'111111111': ('ANN', 'DB LAST', 'M')})
+    data = pd.DataFrame([row('111111111'), row('999999999'), row('123-45-6789')], columns=COLUMNS)
+
+    clean, exceptions = DataProcessor.clean_and_handle_exceptions(data)
+
+    matched = clean.iloc[0]
+    assert (matched['Organization First Name'], matched['Organization Middle Name'],
+            matched['Organization Last Name']) == ('ANN', 'M', 'DB LAST')
+    for _, unmatched in exceptions.iterrows():
+        assert (unmatched['Organization First Name'], unmatched['Organization Middle Name'],
+                unmatched['Organization Last Name']) == ('JOHN', 'Q', 'SOURCE')
+
+
+def test_keyword_matches_source_name_before_database_substitution(reference_records):
+    reference_records({'111111111': ('RIVER CLUB INC', 'DB LAST', None)})
+    data = pd.DataFrame([row('111111111', first='JOHN')], columns=COLUMNS)
+
+    clean, exceptions = DataProcessor.clean_and_handle_exceptions(data)
+
+    assert exceptions.empty
+    assert clean['Organization First Name'].tolist() == ['RIVER CLUB INC']
+
@@ -0,0 +1,43 @@
+import logging
+import os
+
+import numpy as np
+
+from main import DataProcessor
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), newline='') as file:
+        return file.read()
+
+
+def format_fixture():
+    data = DataProcessor.read_data(os.path.join(FIXTURES, 'format_source.csv'))
+    # Middle names missing from the database arrive as NaN after the lookup.
+    data.loc[1, 'Organization Middle Name'] = np.nan
+    formatted = DataProcessor.format_output(data)
+    return formatted + DataProcessor.format_footer(formatted.count('\n') - 1)
+
+
+def test_format_output_matches_golden_file():
+    assert format_fixture() == read_fixture('format_expected.txt')
+
+
+def test_invalid_values_are_logged(caplog):
+    with caplog.at_level(logging.ERROR):
+        format_fixture()
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(message.startswith("Method Failed: format_output, Error: Error parsing date 13/45/2026:") for message in messages)
+    assert any(message.startswith("Method Failed: format_output, Error: Error parsing date :") for message in messages)
+    assert "Method Failed: format_output, Error: Failed to convert amount for record: 1000.50" in messages
+    assert "Method Failed: format_output, Error: Failed to convert amount for record: " in messages
+    assert not any('-5' in message for message in messages)
+    assert len(messages) == 4
+
+
+def test_negative_amount_uses_scalar_fallback():
+    records = format_fixture().split('\n')
+    assert 'InvalidDate-0000000005' in records[4]
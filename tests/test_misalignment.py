@@ -0,0 +1,67 @@
+import pandas as pd
+
+from main import DataProcessor, PipelineMetrics
+
+COLUMNS = ['Tax ID', 'Organization First Name', 'Organization Middle Name', 'Organization Last Name',
+           'Organization Street Line1 Address', 'Organization Street Line2 Address', 'Organization City',
+           'Organization State', 'Organization Zip code', 'Start Date of Contract', 'Amount of Contract',
+           'extra_col_Unnamed: 11']
+
+
+def aligned(tax_id, line1='100 MAIN ST'):
+    return [tax_id, 'JOHN', 'A', 'SMITH', line1, 'APT 4', 'SACRAMENTO', 'CA', '95814', '01/02/2026', '$100', '']
+
+
+def split_address(tax_id, zip_code='95814'):
+    # A stray street number was written into Line1 and pushed every later field one column right.
+    return [tax_id, 'JOHN', 'A', 'SMITH', '100', '100 MAIN ST', 'APT 4', 'SACRAMENTO', 'CA', zip_code, '01/02/2026', '$100']
+
+
+def realign(rows):
+    metrics = PipelineMetrics(None)
+    data = pd.DataFrame(rows, columns=COLUMNS)
+    return DataProcessor.correct_misalignment(data, metrics), metrics
+
+
+def test_no_misaligned_rows_leaves_frame_unchanged():
+    rows = [aligned('111111111'), aligned('222222222', line1='PO BOX 7')]
+    data, metrics = realign(rows)
+
+    pd.testing.assert_frame_equal(data, pd.DataFrame(rows, columns=COLUMNS))
+    assert metrics.counters['realigned_rows'] == 0
+
+
+def test_each_misaligned_row_shifts_exactly_once():
+    data, metrics = realign([split_address('111111111'),
+                             aligned('222222222'),
+                             split_address('333333333', zip_code='95814-1234'),
+                             split_address('444444444', zip_code='95630')])
+
+    assert metrics.counters['realigned_rows'] == 3
+    for position, tax_id, zip_code in ((0, '111111111', '95814'), (2, '333333333', '95814-1234'), (3, '444444444', '95630')):
+        expected = aligned(tax_id)[:-1]
+        expected[8] = zip_code
+        assert data.iloc[position].tolist()[:-1] == expected
+        assert pd.isna(data.iloc[position]['extra_col_Unnamed: 11'])
+    assert data.iloc[1].tolist() == aligned('222222222')
+
+
+def test_non_ascii_alphabetic_line1_is_not_shifted():
+    data, metrics = realign([aligned('111111111', line1='ÉCOLE ÑANDÚ'), aligned('222222222', line1='１２３')])
+
+    assert metrics.counters['realigned_rows'] == 1
+    assert data.iloc[0].tolist() == aligned('111111111', line1='ÉCOLE ÑANDÚ')
+    assert data.iloc[1]['Organization Street Line2 Address'] == 'SACRAMENTO'
+
+
+def test_numeric_column_in_shifted_block_keeps_integer_values():
+    data = pd.DataFrame([aligned('111111111'), split_address('222222222')], columns=COLUMNS)
+    # Zip codes parsed as integers, as the default CSV engine infers them.
+    data['Organization Zip code'] = [95814, 95630]
+    metrics = PipelineMetrics(None)
+
+    data = DataProcessor.correct_misalignment(data, metrics)
+
+    assert metrics.counters['realigned_rows'] == 1
+    assert str(data.iloc[0]['Organization Zip code']) == '95814'
+    assert str(data.iloc[1]['Organization State']) == '95630'
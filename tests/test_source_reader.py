@@ -0,0 +1,65 @@
+import os
+
+import pandas as pd
+import pytest
+
+import main
+from main import SourceReader
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+SOURCE = os.path.join(FIXTURES, 'format_source.csv')
+
+
+def data_line_count():
+    with open(SOURCE) as file:
+        return sum(1 for _ in file) - SourceReader.PREAMBLE_LINES - 1
+
+
+def read_source(monkeypatch, engine_module):
+    monkeypatch.setattr(main, 'pyarrow', engine_module)
+    with SourceReader(SOURCE) as source:
+        return source.read()
+
+
+def assert_reads_after_header(data):
+    assert list(data.columns[:3]) == ['Tax ID', 'Organization First Name', 'Organization Middle Name']
+    assert data.columns[-1] == 'Unnamed: 11'
+    assert len(data) == data_line_count()
+    assert data.loc[0, 'Tax ID'] == '111111111'
+    assert not (data['Tax ID'] == 'Tax ID').any()
+
+
+def test_default_engine_reads_after_header(monkeypatch):
+    data = read_source(monkeypatch, None)
+
+    assert_reads_after_header(data)
+    assert data.loc[1, 'Organization Middle Name'] == ''
+    assert data.loc[1, 'Amount of Contract'] == '$7'
+
+
+def test_pyarrow_engine_matches_default_engine(monkeypatch):
+    pyarrow = pytest.importorskip('pyarrow')
+    expected = read_source(monkeypatch, None)
+
+    data = read_source(monkeypatch, pyarrow)
+
+    assert_reads_after_header(data)
+    pd.testing.assert_frame_equal(data, expected)
+
+
+def test_errors_name_the_file_and_its_line_numbers(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'pyarrow', None)
+    with open(SOURCE) as file:
+        lines = file.read().splitlines()
+    empty_file = tmp_path / 'empty.csv'
+    empty_file.write_text('\n'.join(lines[:SourceReader.PREAMBLE_LINES + 1]) + '\n')
+    malformed_file = tmp_path / 'malformed.csv'
+    lines[8] += ',x,y,z'
+    malformed_file.write_text('\n'.join(lines) + '\n')
+
+    with pytest.raises(ValueError, match=f"No data found in {empty_file}$"):
+        with SourceReader(str(empty_file)) as source:
+            main.DataProcessor.read_data(source)
+    with pytest.raises(pd.errors.ParserError, match='Expected 12 fields in line 9, saw 15'):
+        with SourceReader(str(malformed_file)) as source:
+            source.read()